@@ -0,0 +1,175 @@
+import argparse
+
+import numpy as np
+
+from simulator import BLOCK_ENDS, COSTS, IO_INSTRUCTIONS, find_leaders, load_program
+
+# Memory cells (of all the lanes together) kept in the NumPy array, the higher addresses are kept in dictionaries
+MAX_MEMORY_CELLS = 1 << 26
+
+
+"""
+Class responsible for running one program over many inputs at once (every input is run in its own lane). The registers
+and the memory of all the lanes are kept in NumPy arrays, so the lanes that are at the same instruction run their basic
+block together. The lanes at the lowest instruction are always run first, so the lanes that went different ways after
+a jump meet again as soon as possible. The numbers are 64-bit, like in the virtual machine (mw.cc). Every lane has a
+dense window of the lowest addresses (its share of MAX_MEMORY_CELLS), the rest of its memory is a dictionary, so every
+address is valid, like in the map of the virtual machine.
+"""
+class BatchVM:
+    """
+    BatchVM's attributes are:
+    - program: list of instructions as (name, argument)
+    - leaders: first instructions of the basic blocks
+    - blocks: instructions of the block starting at the instruction, along with the cost and the cost of the input/output
+    """
+    def __init__(self, program):
+        self.program = program
+        self.leaders = find_leaders(program)
+        self.blocks = {}
+
+    def block(self, start):
+        if start not in self.blocks:
+            end = start
+            while True:
+                name = self.program[end][0]
+                end += 1
+                if name in BLOCK_ENDS or end in self.leaders or end == len(self.program):
+                    break
+            instructions = [(i, self.program[i][0], self.program[i][1]) for i in range(start, end)]
+            time = sum(COSTS.get(name, 1) for _, name, _ in instructions if name not in IO_INSTRUCTIONS)
+            io = sum(COSTS[name] for _, name, _ in instructions if name in IO_INSTRUCTIONS)
+            self.blocks[start] = instructions, time, io
+        return self.blocks[start]
+
+    """
+    Runs the program for every list of input numbers and returns (written numbers, cost, cost of the input/output,
+    error) of every lane. The registers start with random values, like in the virtual machine, unless they are given
+    (the same ones for every lane). The lanes whose cost exceeds 'max_cost' are stopped (e.g. the ones that never end).
+    """
+    def run(self, inputs, registers=None, max_cost=None):
+        lanes = len(inputs)
+        lengths = np.array([len(numbers) for numbers in inputs], dtype=np.int64)
+        data = np.zeros((lanes, max([len(numbers) for numbers in inputs] + [1])), dtype=np.int64)
+        for lane, numbers in enumerate(inputs):
+            data[lane, :len(numbers)] = numbers
+        positions = np.zeros(lanes, dtype=np.int64)
+
+        if registers is None:
+            all_registers = np.random.randint(0, 2 ** 31, size=(8, lanes), dtype=np.int64)
+        else:
+            all_registers = np.repeat(np.array(registers, dtype=np.int64).reshape(8, 1), lanes, axis=1)
+        window = MAX_MEMORY_CELLS // max(lanes, 1)
+        memory = np.zeros((lanes, min(1024, window)), dtype=np.int64)
+        far_memory = [{} for _ in range(lanes)]
+        instruction = np.zeros(lanes, dtype=np.int64)
+        running = np.ones(lanes, dtype=bool)
+        times = np.zeros(lanes, dtype=np.int64)
+        io_costs = np.zeros(lanes, dtype=np.int64)
+        outputs = [[] for _ in range(lanes)]
+        errors = [None] * lanes
+
+        def stop(failed, message):
+            for lane in failed.tolist():
+                errors[lane] = message
+            running[failed] = False
+
+        while running.any():
+            active = np.flatnonzero(running)
+            start = int(instruction[active].min())
+            group = active[instruction[active] == start]
+            if start >= len(self.program):
+                stop(group, f"Call of a nonexistent instruction {start}")
+                continue
+            instructions, time, io = self.block(start)
+            times[group] += time
+            io_costs[group] += io
+            if max_cost is not None:
+                exceeded = times[group] + io_costs[group] > max_cost
+                if exceeded.any():
+                    stop(group[exceeded], f"The cost exceeded {max_cost}")
+                    group = group[~exceeded]
+            r = all_registers[:, group]
+            next_instruction = np.full(len(group), instructions[-1][0] + 1, dtype=np.int64)
+            for i, name, operand in instructions:
+                if name == "READ":
+                    missing = positions[group] >= lengths[group]
+                    if missing.any():
+                        stop(group[missing], "Not enough input numbers")
+                        group, r, next_instruction = group[~missing], r[:, ~missing], next_instruction[~missing]
+                    r[0] = data[group, positions[group]]
+                    positions[group] += 1
+                elif name == "WRITE":
+                    for lane, value in zip(group.tolist(), r[0].tolist()):
+                        outputs[lane].append(value)
+                elif name in ("LOAD", "STORE"):
+                    addresses = r[operand]
+                    # The addresses outside of the window (the negative numbers are the highest ones of mw.cc)
+                    far = (addresses < 0) | (addresses >= window)
+                    near = ~far
+                    if near.any():
+                        highest = addresses[near].max()
+                        if highest >= memory.shape[1]:
+                            size = memory.shape[1]
+                            while size <= highest:
+                                size *= 2
+                            memory = np.pad(memory, ((0, 0), (0, min(size, window) - memory.shape[1])))
+                        if name == "LOAD":
+                            r[0, near] = memory[group[near], addresses[near]]
+                        else:
+                            memory[group[near], addresses[near]] = r[0, near]
+                    for k in np.flatnonzero(far).tolist():
+                        cells = far_memory[int(group[k])]
+                        if name == "LOAD":
+                            r[0, k] = cells.get(int(addresses[k]), 0)
+                        else:
+                            cells[int(addresses[k])] = int(r[0, k])
+                elif name == "ADD":
+                    r[0] += r[operand]
+                elif name == "SUB":
+                    r[0] = np.where(r[0] >= r[operand], r[0] - r[operand], 0)
+                elif name == "GET":
+                    r[0] = r[operand]
+                elif name == "PUT":
+                    r[operand] = r[0]
+                elif name == "RST":
+                    r[operand] = 0
+                elif name == "INC":
+                    r[operand] += 1
+                elif name == "DEC":
+                    r[operand] -= r[operand] > 0
+                elif name == "SHL":
+                    r[operand] <<= 1
+                elif name == "SHR":
+                    r[operand] >>= 1
+                elif name == "STRK":
+                    r[operand] = i
+                elif name == "JUMP":
+                    next_instruction[:] = operand
+                elif name == "JPOS":
+                    next_instruction = np.where(r[0] > 0, operand, i + 1)
+                elif name == "JZERO":
+                    next_instruction = np.where(r[0] == 0, operand, i + 1)
+                elif name == "JUMPR":
+                    next_instruction = r[operand].copy()
+                elif name == "HALT":
+                    running[group] = False
+            all_registers[:, group] = r
+            instruction[group] = next_instruction
+
+        costs = times + io_costs
+        return [(outputs[lane], int(costs[lane]), int(io_costs[lane]), errors[lane]) for lane in range(lanes)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs a program of the virtual machine over many inputs at once.")
+    parser.add_argument("program_file", help="compiled program (text or binary)")
+    parser.add_argument("inputs_file",
+                        help="file with the input numbers of one run in every line (an empty line for a run without input)")
+    args = parser.parse_args()
+
+    with open(args.inputs_file) as f:
+        batch = [[int(token) for token in line.split()] for line in f]
+    for lane, (written, cost, io_cost, error) in enumerate(BatchVM(load_program(args.program_file)).run(batch)):
+        result = f"error: {error}" if error is not None else f"cost: {cost}; i/o: {io_cost}"
+        print(f"{lane}: {' '.join(map(str, written))} ({result})")
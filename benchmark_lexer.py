@@ -0,0 +1,60 @@
+import argparse
+import glob
+import os
+import time
+
+from sly import Lexer
+
+from main import ImperativeLexer
+
+TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests")
+
+
+def token_stream(tokenize, text):
+    return [(tok.type, tok.value, tok.lineno, tok.index, tok.end) for tok in tokenize(ImperativeLexer(), text)]
+
+
+# The best time of the runs (in seconds) and the tokens of the text
+def measure(tokenize, text, runs):
+    best = None
+    tokens = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        tokens = list(tokenize(ImperativeLexer(), text))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(tokens)
+
+
+"""
+Function responsible for the source of the benchmark: the programs of the tests that are tokenized without errors
+(each one starting on a new line) repeated until the text has at least 'size' characters.
+"""
+def build_source(size):
+    programs = []
+    for path in sorted(glob.glob(os.path.join(TESTS, "*.imp"))):
+        with open(path) as f:
+            text = f.read()
+        try:
+            list(ImperativeLexer().tokenize(text))
+        except Exception:
+            continue
+        programs.append(text.rstrip("\n") + "\n")
+    source = "".join(programs)
+    return source * max(1, -(-size // len(source)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measures the throughput of the lexer (SLY's rules and the fast scanner).")
+    parser.add_argument("--size", type=int, default=1_000_000, help="number of the characters of the tokenized source")
+    parser.add_argument("--runs", type=int, default=5, help="number of the runs (the best one is shown)")
+    args = parser.parse_args()
+
+    text = build_source(args.size)
+    if token_stream(Lexer.tokenize, text) != token_stream(ImperativeLexer.tokenize, text):
+        raise SystemExit("The scanner's tokens differ from the ones of SLY!")
+
+    print(f"Source: {len(text)} characters, {text.count(chr(10))} lines")
+    for name, tokenize in (("SLY", Lexer.tokenize), ("scanner", ImperativeLexer.tokenize)):
+        elapsed, count = measure(tokenize, text, args.runs)
+        print(f"{name:<8} {count} tokens in {elapsed * 1000:9.2f} ms ({count / elapsed:12,.0f} tokens/s)")
@@ -0,0 +1,62 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# The smallest program, so the time is mostly the startup of the compiler
+TINY_PROGRAM = "PROGRAM IS\n  a\nIN\n  a := 1;\n  WRITE a;\nEND\n"
+COMPILER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+def run_compiler(home, source, output, extra=()):
+    # The parser's tables and the compile cache are kept in the home folder, so it decides what is cached
+    env = dict(os.environ, HOME=home)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, COMPILER, source, output, *extra], env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+"""
+Function responsible for measuring the startup of 'python3 main.py': every case is run 'runs' times and the times
+of the whole process are returned by the case's name. The runs use their own home folders, so the caches of the
+user are never touched:
+- cold: no parser's tables on the disk (they are built and written, like in the first run after a grammar change)
+- warm: the parser's tables are loaded from the disk
+- cache hit: the program is taken from the compile cache (lexing, parsing and encoding are skipped)
+"""
+def measure_startup(runs, source):
+    results = {"cold": [], "warm": [], "cache hit": []}
+    with tempfile.TemporaryDirectory() as folder:
+        output = os.path.join(folder, "out.mr")
+        for _ in range(runs):
+            with tempfile.TemporaryDirectory() as home:
+                results["cold"].append(run_compiler(home, source, output, ["--no-cache"]))
+
+        warm_home = os.path.join(folder, "warm")
+        os.mkdir(warm_home)
+        run_compiler(warm_home, source, output)
+        for _ in range(runs):
+            results["warm"].append(run_compiler(warm_home, source, output, ["--no-cache"]))
+        for _ in range(runs):
+            results["cache hit"].append(run_compiler(warm_home, source, output))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measures the startup time of the compiler (python3 main.py).")
+    parser.add_argument("--runs", type=int, default=10, help="number of the runs of every case")
+    parser.add_argument("--program", help="compiled program (a tiny one by default)")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix=".imp", delete=False) as f:
+        f.write(TINY_PROGRAM)
+    try:
+        results = measure_startup(args.runs, args.program or f.name)
+    finally:
+        os.remove(f.name)
+    for name, times in results.items():
+        print(f"{name:<10} median {statistics.median(times) * 1000:8.2f} ms, "
+              f"min {min(times) * 1000:8.2f} ms ({len(times)} runs)")
@@ -0,0 +1,273 @@
+import contextlib
+import hashlib
+import io
+import os
+import pickle
+import re
+import sys
+
+from call_graph import reachable_procedures
+from globals import COMPILER_VERSION, program_lines, get_debug_table
+
+# Default place and size (in bytes) of the on-disk compile cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "imperative_compiler")
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+# Files of the compiler that have an influence on the generated code
+COMPILER_FILES = ["main.py", "encoder.py", "symbols.py", "procedure_symbols.py", "globals.py", "cache.py",
+                  "layout.py", "cse.py", "constants.py", "unroll.py",
+                  "partial_eval.py", "call_graph.py", "pgo.py", "scanner.py", "ranges.py"]
+
+
+# Writes everything both to the original stream and to the memory (used to capture the warnings)
+class Tee(io.TextIOBase):
+    def __init__(self, stream):
+        self.stream = stream
+        self.captured = io.StringIO()
+
+    def write(self, text):
+        self.captured.write(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def getvalue(self):
+        return self.captured.getvalue()
+
+
+# Class responsible for storing already compiled programs on the disk
+class CompileCache:
+    """
+    CompileCache's attributes are:
+    - directory: folder in which the entries are kept (one file per entry)
+    - max_size: maximal size of all entries together, the least recently used ones are removed first
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    """
+    Function responsible for creating a key from the source code, the compiler and the flags
+    """
+    def key(self, text, flags=()):
+        digest = hashlib.sha256()
+        digest.update(COMPILER_VERSION.encode())
+        digest.update(compiler_fingerprint().encode())
+        digest.update(repr(sorted(flags)).encode())
+        digest.update(text.encode())
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.entry")
+
+    # Returns the pair (code, diagnostics) or None if the program has not been compiled yet
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # Marking the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["code"], entry["diagnostics"], entry.get("instructions")
+
+    # The number of the instructions is kept for the statistics (the code itself may be in the binary format)
+    def put(self, key, code, diagnostics, instructions=None):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Writing to a temporary file first, so a half-written entry is never read
+            path = self.entry_path(key)
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, 'wb') as f:
+                pickle.dump({"code": code, "diagnostics": diagnostics, "instructions": instructions}, f)
+            os.replace(temporary_path, path)
+            self.evict()
+        except OSError as e:
+            print(f"WARNING: Could not write to the compile cache ({e})!", file=sys.stderr)
+
+    # Removing the least recently used entries until the cache fits in its size limit
+    def evict(self):
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".entry"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+
+# Class responsible for reusing the code of procedures that were already encoded in the same state
+class ProcedureCache:
+    """
+    ProcedureCache's attributes are:
+    - disk: compile cache used to keep the entries between the runs (None if kept only in memory)
+    - entries: entries already used during this run
+    - hits, misses: number of reused and encoded procedures
+
+    A procedure's code depends on its body, its signature, the memory layout of its symbols (including the addresses
+    bound to its arguments) and the same things for every procedure called inside. All of it is a part of the key.
+    The procedures are encoded from the address 0 (the encoder links the code to its place), so the code is stored as
+    it is, and the line numbers in the warnings relative to the procedure's first line. When the debug table is written, the entry keeps the procedure's part of the table as well.
+    """
+    def __init__(self, disk=None):
+        self.disk = disk
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def create_assembly_code(self, encoder):
+        closure = called_encoders(encoder)
+        key = self.key(encoder, closure)
+
+        entry = self.entries.get(key)
+        if entry is None and self.disk is not None:
+            disk_entry = self.disk.get(key)
+            if disk_entry is not None:
+                entry = disk_entry[0]
+
+        if entry is None:
+            self.misses += 1
+            # Encoding the procedure and remembering what it changed
+            captured = io.StringIO()
+            with contextlib.redirect_stdout(captured):
+                encoder.create_assembly_code()
+            entry = {
+                "code": encoder.code,
+                "states": [encoder_state(e, True) for e in closure],
+                "diagnostics": shift_lines(captured.getvalue(), -encoder.lineno_offset),
+            }
+            table = get_debug_table()
+            if table is not None:
+                entry["table"] = table
+            self.entries[key] = entry
+            if self.disk is not None:
+                self.disk.put(key, entry, "")
+        else:
+            self.hits += 1
+            self.entries[key] = entry
+            # Repeating the changes made by the encoding
+            for e, state in zip(closure, entry["states"]):
+                apply_encoder_state(e, state)
+            encoder.code = list(entry["code"])
+            encoder.symbols.end_address = len(encoder.code)
+            table = get_debug_table()
+            if table is not None:
+                table.extend(entry["table"], 0)
+
+        print(shift_lines(entry["diagnostics"], encoder.lineno_offset), end="")
+
+    def key(self, encoder, closure):
+        digest = hashlib.sha256()
+        digest.update(COMPILER_VERSION.encode())
+        digest.update(compiler_fingerprint().encode())
+        for e in closure:
+            digest.update(repr(canonical(e.commands)).encode())
+            digest.update(repr(e.symbols.args).encode())
+            # Arguments of the procedures called inside are bound again before they are used
+            digest.update(repr(encoder_state(e, e is encoder)).encode())
+            digest.update(repr(e.lineno_offset - encoder.lineno_offset).encode())
+            digest.update(repr(lines_layout(e)).encode())
+        # The debug table names the caller's symbols passed as the arguments (their memory may be shared with others)
+        if get_debug_table() is not None:
+            digest.update(repr(sorted(encoder.argument_owners.items())).encode())
+        return f"proc-{digest.hexdigest()}"
+
+
+# Returns the encoder and the encoders of all procedures it calls (directly or not)
+def called_encoders(encoder):
+    return [encoder] + [encoder.procedures[name] for name in reachable_procedures(encoder.calls, encoder.procedures)]
+
+
+# State of the encoder's symbols that the generated code depends on (and that the encoding changes)
+def encoder_state(encoder, with_arguments):
+    symbols = []
+    for name, symbol in encoder.symbols.items():
+        is_argument = name in encoder.symbols.args
+        address = symbol.memory_offset if with_arguments or not is_argument else None
+        size = getattr(symbol, "size", None) if with_arguments or not is_argument else None
+        symbols.append((name, type(symbol).__name__, address, size, getattr(symbol, "initialized", None)))
+    return symbols
+
+
+def apply_encoder_state(encoder, state):
+    for name, _, address, size, initialized in state:
+        symbol = encoder.symbols[name]
+        symbol.memory_offset = address
+        if size is not None:
+            symbol.size = size
+        if initialized is not None:
+            symbol.initialized = initialized
+
+
+# First tokens of the procedure's lines (relative to its first line), they decide the line numbers of the warnings
+def lines_layout(encoder):
+    layout = []
+    for token_type, lineno in program_lines:
+        if lineno > encoder.lineno_offset and token_type in ("PROCEDURE", "PROGRAM"):
+            break
+        if lineno >= encoder.lineno_offset:
+            layout.append((token_type, lineno - encoder.lineno_offset))
+    return layout
+
+
+# Moving all jumps of the code by the given offset
+def relocate(code, offset):
+    relocated = []
+    for line in code:
+        parts = line.split()
+        if parts[0] in ("JUMP", "JPOS", "JZERO"):
+            line = f"{parts[0]} {int(parts[1]) + offset}"
+        relocated.append(line)
+    return relocated
+
+
+def shift_lines(text, offset):
+    return re.sub(r"\(line (\d+)\)", lambda m: f"(line {int(m.group(1)) + offset})", text)
+
+
+# Turning the sets into sorted tuples, so the representation does not depend on the order of the elements
+def canonical(value):
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(value))
+    elif isinstance(value, (tuple, list)):
+        return tuple(canonical(v) for v in value)
+    return value
+
+
+compiler_digest = None
+
+
+# Hash of the compiler's source code, so the cache is invalidated whenever the compiler changes
+def compiler_fingerprint():
+    global compiler_digest
+    if compiler_digest is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in COMPILER_FILES:
+            try:
+                with open(os.path.join(directory, name), 'rb') as f:
+                    digest.update(f.read())
+            except OSError:
+                digest.update(name.encode())
+        compiler_digest = digest.hexdigest()
+    return compiler_digest
@@ -0,0 +1,34 @@
+"""
+The call graph of the program is built by the parser: every encoder keeps the names of the procedures called directly
+by its commands ('calls'), and 'procedures' maps the names to the procedures' encoders. A procedure can only call the
+ones defined before it, so the graph has no cycles and the order of the definitions is already a topological order
+(the called procedures come first).
+"""
+
+
+# Names of the procedures called by the given ones (directly or not), in the order they are reached
+def reachable_procedures(names, procedures):
+    reached = []
+    seen = set()
+    pending = list(names)
+    i = 0
+    while i < len(pending):
+        name = pending[i]
+        i += 1
+        if name not in seen and name in procedures:
+            seen.add(name)
+            reached.append(name)
+            pending += procedures[name].calls
+    return reached
+
+
+"""
+Function responsible for removing the procedures that are never called by the main program (directly or not).
+Their code would never be generated (the procedures are inlined), but their locals would still get the memory.
+"""
+def remove_uncalled_procedures(encoders):
+    main = encoders[-1]
+    called = set(reachable_procedures(main.calls, main.procedures))
+    encoders[:] = [encoder for encoder in encoders if not encoder.is_procedure or encoder.symbols.name in called]
+    for name in [name for name in main.procedures if name not in called]:
+        del main.procedures[name]
@@ -0,0 +1,27 @@
+# Instructions used to create the constants (after RST): I - INC, S - SHL, D - DEC
+INSTRUCTIONS = {"I": "INC", "S": "SHL", "D": "DEC"}
+
+
+"""
+Function responsible for the shortest sequence with INC, DEC and SHL creating the value after RST. The bits are taken
+from the most significant one, keeping the best sequences for the prefix p and for p + 1 (so the runs of ones are
+created as 2^k - 1 = 2^k, DEC).
+"""
+def const_sequence(value):
+    if value == 0:
+        return ""
+    # Sequences for the prefix 1 and for 2
+    prefix, next_prefix = "I", "IS"
+    for bit in bin(value)[3:]:
+        if bit == '0':
+            # 2p = p, SHL and 2p + 1 = p, SHL, INC or (p + 1), SHL, DEC
+            prefix, next_prefix = prefix + "S", min(prefix + "SI", next_prefix + "SD", key=len)
+        else:
+            # 2p + 1 = p, SHL, INC or (p + 1), SHL, DEC and 2p + 2 = (p + 1), SHL
+            prefix, next_prefix = min(prefix + "SI", next_prefix + "SD", key=len), next_prefix + "S"
+    return prefix
+
+
+# Number of instructions that 'Encoder.create_const' needs to create the value (including RST)
+def create_const_cost(value):
+    return 1 + len(const_sequence(value))
@@ -0,0 +1,89 @@
+from unroll import unrolled_blocks
+
+# The values kept in the registers that are not used by the rest of the code
+CACHE_REGISTERS = ('g', 'h')
+
+
+# Names of the symbols whose change changes the value (a variable's name or an array's element ('array', name, index))
+def value_symbols(value):
+    if type(value) == str:
+        return [value]
+    if type(value[2]) == tuple and type(value[2][1]) == str:
+        return [value[1], value[2][1]]
+    return [value[1]]
+
+
+# Counting the values loaded inside the commands (variables' names and arrays' elements)
+def count_loads(commands, counts):
+    def load_identifier(identifier):
+        if type(identifier) == str:
+            counts[identifier] = counts.get(identifier, 0) + 1
+        elif identifier[0] == "array":
+            counts[identifier] = counts.get(identifier, 0) + 1
+            index_identifier(identifier)
+
+    def index_identifier(identifier):
+        if identifier[0] == "array" and type(identifier[2]) == tuple and type(identifier[2][1]) == str:
+            load_identifier(identifier[2][1])
+
+    def load_expression(expression):
+        if expression[0] == "load":
+            load_identifier(expression[1])
+        elif expression[0] != "const":
+            load_expression(expression[1])
+            load_expression(expression[2])
+
+    for command in commands:
+        if command[0] == "assign":
+            load_expression(command[2])
+            if type(command[1]) == tuple:
+                index_identifier(command[1])
+        elif command[0] == "read":
+            if type(command[1]) == tuple:
+                index_identifier(command[1])
+        elif command[0] == "write":
+            load_expression(command[1])
+        elif command[0] in ("if", "while", "until"):
+            load_expression(command[1])
+            count_loads(command[2], counts)
+        elif command[0] == "ifelse":
+            load_expression(command[1])
+            count_loads(command[2], counts)
+            count_loads(command[3], counts)
+        elif command[0] == "unrolled":
+            for condition, block, _ in unrolled_blocks(command):
+                if condition is not None:
+                    load_expression(condition)
+                count_loads(block, counts)
+    return counts
+
+
+# Class responsible for telling if a loaded value is going to be loaded again (so it is worth keeping in a register)
+class ReuseHints:
+    """
+    ReuseHints's attributes are:
+    - counts: loads of every value inside every command (including the nested ones)
+    - last_position: index of the last command that loads the value
+    - current: index of the command that is being encoded
+    - remaining: loads of the current command that have not been encoded yet
+    """
+    def __init__(self, commands):
+        self.counts = [count_loads([command], {}) for command in commands]
+        self.last_position = {}
+        for i, counts in enumerate(self.counts):
+            for value in counts:
+                self.last_position[value] = i
+        self.current = 0
+        self.remaining = {}
+
+    def start(self, index):
+        self.current = index
+        self.remaining = dict(self.counts[index])
+
+    # Marks one load of the value as encoded
+    def use(self, value):
+        if self.remaining.get(value, 0) > 0:
+            self.remaining[value] -= 1
+
+    def loaded_again(self, value):
+        return self.remaining.get(value, 0) > 0 or self.last_position.get(value, -1) > self.current
@@ -1,7 +1,31 @@
+import contextlib
+import io
+
 from symbols import Variable, Array
 from procedure_symbols import ProcedureVariable, ProcedureArgsVariable, ProcedureArray, ProcedureArgsArray
 
-from globals import modify_global_consts_address, program_lines, get_global_command_lineno, modify_global_command_lineno, get_global_consts_address
+from globals import program_lines, program_lines_positions, next_program_line, get_global_command_lineno, modify_global_command_lineno, get_procedure_cache, get_compiler_stats, get_debug_table, modify_debug_table
+from stats import measure
+from cache import relocate
+from cse import CACHE_REGISTERS, ReuseHints, value_symbols
+from constants import const_sequence, INSTRUCTIONS
+from ranges import UNKNOWN, bit_length, is_nonzero
+
+
+JUMPS = ("JUMP", "JPOS", "JZERO")
+# Conditions that are met exactly when the given ones are not
+NEGATED_CONDITIONS = {"eq": "ne", "ne": "eq", "lt": "ge", "ge": "lt", "gt": "le", "le": "gt"}
+# Worst cost of the checks before the multiplication loop and of one of its iterations
+MULTIPLICATION_CHECKS_COST = 13
+MULTIPLICATION_BIT_COST = 24
+# Operands of a multiplication with at most this many bits (and quotients of a division by a known number) are done
+# by a fixed number of unrolled steps instead of a loop
+MAX_UNROLLED_BITS = 8
+
+
+# Hiding the warnings of the code that is created again from the same lines
+def hidden_warnings(hidden=True):
+    return contextlib.redirect_stdout(io.StringIO()) if hidden else contextlib.nullcontext()
 
 
 # Class responsible for translating the commands into assembly code
@@ -10,30 +34,65 @@ class Encoder:
     Encoder's attributes are:
     - commands: list of received commands
     - symbols: list of local variables (arguments)
-    - earlier_symbols: list of all procedures (along with their attributes) that are visible
+    - encoders: encoders of the whole program (the parser's list, shared by all of them, the procedures come first)
+    - procedures: encoders of the procedures by their names (shared by all of them)
+    - calls: names of the procedures called directly by the commands (edges of the call graph)
     - code_offset: information about how long the already generated assembly code is and where currently are we
-    - code: generated assembly code
+    - code: generated assembly code (only the part that has not been passed to the writer yet)
+    - writer: receives the finished parts of the main program's code (if None, the whole code stays in 'code')
+    - cached: values (variables and arrays' elements) kept in the cache registers, the least recently used first
+    - hints: tells which of the loaded values are going to be loaded again
+    - accumulator: value that is in 'a' and the position in the code up to which it is there
+    - argument_owners: (procedure's name, symbol's name) of the caller's symbol passed as every argument in the current
+      call (only kept when the debug table is written)
+    - ranges: ranges of the operands of the multiplications, divisions and remainders by the ids of their expressions
+      (ranges.py)
     """
-    def __init__(self, commands, symbols, earlier_encoders, is_procedure, lineno_offset):
+    def __init__(self, commands, symbols, encoders, procedures, calls, is_procedure, lineno_offset):
         self.is_procedure = is_procedure
         self.lineno_offset = lineno_offset
         self.commands = commands
         self.symbols = symbols
-        self.earlier_encoders = earlier_encoders.copy()
+        self.encoders = encoders
+        self.procedures = procedures
+        self.calls = calls
         self.code_offset = 0
         self.code = []
         self.is_in_loop = False
+        self.writer = None
+        self.cached = {}
+        self.hints = None
+        self.accumulator = None
+        self.argument_owners = {}
+        self.ranges = {}
 
     def create_assembly_code(self):
+        self.forget_cached()
         if self.is_procedure:
             self.create_assembly_code_from_commands(self.commands)
             self.symbols.end_address = len(self.code)
         else:
-            self.create_assembly_code_from_commands(self.commands)
+            self.create_assembly_code_from_commands(self.commands, top_level=True)
             self.code.append("HALT")
-
-    def create_assembly_code_from_commands(self, commands):
-        for command in commands:
+            self.flush_code()
+            if self.writer is None:
+                self.thread_jumps()
+
+    # Passing the finished code to the writer (the code offset keeps the positions of the next instructions)
+    def flush_code(self):
+        if self.writer is not None:
+            self.thread_jumps()
+            with measure("write"):
+                self.writer.write(self.code)
+            self.code_offset += len(self.code)
+            self.code = []
+
+    def create_assembly_code_from_commands(self, commands, top_level=False):
+        outer_hints = self.hints
+        hints = ReuseHints(commands)
+        for i, command in enumerate(commands):
+            hints.start(i)
+            self.hints = hints
             # command[1] - ('load', 'n') || ('const', 2)
             if command[0] == "write":
                 self.find_command_lineno('WRITE')
@@ -41,12 +100,17 @@ class Encoder:
                 register = 'b'
                 register1 = 'c'
                 if value[0] == "load":
+                    loaded = False
                     if type(value[1]) == tuple:
                         if value[1][0] == "undeclared":
                             var = value[1][1]
                             self.load_variable_address(var, register1, declared=False)
                         elif value[1][0] == "array":
-                            self.load_array_address_at(value[1][1], value[1][2], register, register1)
+                            loaded = self.load_cached(value[1], 'a')
+                            if loaded:
+                                self.check_array_index(value[1][1], value[1][2])
+                            else:
+                                self.load_array_address_at(value[1][1], value[1][2], register, register1)
                     else:
                         if type(self.symbols[value[1]]) == Array or type(self.symbols[value[1]]) == ProcedureArray or type(
                                 self.symbols[value[1]]) == ProcedureArgsArray:
@@ -54,27 +118,19 @@ class Encoder:
                         if self.symbols[value[1]].initialized or self.is_in_loop:
                             if self.is_in_loop:
                                 print(f"WARNING: Variable {value[1]} may not have been initialized (line {get_global_command_lineno()})!")
-                            self.load_variable_address(value[1], register)
+                            loaded = self.load_cached(value[1], 'a')
+                            if not loaded:
+                                self.load_variable_address(value[1], register)
                         else:
                             raise Exception(f"Use of uninitialized variable {value[1]} (line {get_global_command_lineno()})!")
+                    if not loaded:
+                        self.code.append(f"LOAD {register}")
+                        self.keep_cached(value[1])
+                        self.set_accumulator(value[1])
 
                 elif value[0] == "const":
-                    address = self.symbols.get_const(value[1])
-                    if address is None:
-                        address = self.symbols.add_const(value[1])
-
-                        self.create_const(address, register)
-                        self.create_const(value[1], register1)
-
-                        # STORE b a = p(r_b) <- r_a
-                        #self.code.append(f"STORE {register1} {register}")
-                        # register1 == x
-                        # register == y
-                        self.code.append(f"GET {register1}")
-                        self.code.append(f"STORE {register}")
-                    else:
-                        self.create_const(address, register)
-                self.code.append(f"LOAD {register}")
+                    # Creating the number costs less than loading it from the memory (and needs no cell stored before)
+                    self.create_const(value[1], 'a')
                 self.code.append(f"WRITE")
 
             elif command[0] == "read":
@@ -92,6 +148,9 @@ class Encoder:
                     self.symbols[target].initialized = True
                 self.code.append(f"READ")
                 self.code.append(f"STORE {register}")
+                self.invalidate_cached(target)
+                self.keep_cached(target)
+                self.set_accumulator(target)
 
             elif command[0] == "assign":
                 self.find_command_lineno('PID')
@@ -101,24 +160,31 @@ class Encoder:
                 target_reg = 'b'
                 second_reg = 'c'
                 third_reg = 'd'
-                self.calculate_expression(expression)
+                self.calculate_expression_to_acc(expression, target_reg, second_reg, third_reg)
                 if type(target) == tuple:
+                    # Computing an address from a variable index needs 'a'
+                    if type(target[2]) == tuple:
+                        self.code.append(f"PUT {target_reg}")
                     self.load_array_address_at(target[1], target[2], second_reg, third_reg)
+                    if type(target[2]) == tuple:
+                        self.code.append(f"GET {target_reg}")
                 else:
                     if type(self.symbols[target]) == Variable or type(self.symbols[target]) == ProcedureVariable or type(self.symbols[target]) == ProcedureArgsVariable:
                         self.load_variable_address(target, second_reg)
                         self.symbols[target].initialized = True
                     else:
                         raise Exception(f"Assigning to array {target} with no index provided (line {get_global_command_lineno()})!")
-                self.code.append(f"GET {target_reg}")
                 self.code.append(f"STORE {second_reg}")
+                # The stored value is still in 'a', so it can be kept instead of being loaded again
+                self.invalidate_cached(target)
+                self.keep_cached(target)
+                self.set_accumulator(target)
 
             elif command[0] == "if":
                 """
                 command[0] - keyword
                 command[1] - condition
                 command[2] - commands in if
-                command[3] - constants
                 """
                 self.find_command_lineno('IF')
                 self.is_in_loop = True
@@ -129,15 +195,15 @@ class Encoder:
                     if condition:
                         self.create_assembly_code_from_commands(command[2])
                 else:
-                    self.prepare_consts_before_block(command[-1])
                     condition_start = len(self.code) + self.code_offset
                     self.check_condition(condition)
                     command_start = len(self.code) + self.code_offset
                     self.create_assembly_code_from_commands(command[2])
                     command_end = len(self.code) + self.code_offset
                     # If the condition is not met, jump outside of 'if' statement
-                    for i in range(condition_start - self.code_offset, command_start - self.code_offset):
-                        self.code[i] = self.code[i].replace('finish', str(command_end))
+                    self.resolve_label(condition_start, command_start, 'finish', command_end)
+                    # The code after 'if' can be reached from two places
+                    self.forget_cached()
                 self.is_in_loop = False
 
             elif command[0] == "ifelse":
@@ -146,7 +212,6 @@ class Encoder:
                 command[1] - condition
                 command[2] - commands in 'if'
                 command[3] - commands in 'else'
-                command[4] - constants
                 """
                 self.find_command_lineno('IF')
                 self.is_in_loop = True
@@ -161,19 +226,20 @@ class Encoder:
                     else:
                         self.create_assembly_code_from_commands(command[3])
                 else:
-                    self.prepare_consts_before_block(command[-1])
                     condition_start = len(self.code) + self.code_offset
                     self.check_condition(command[1])
                     if_start = len(self.code) + self.code_offset
+                    # Both parts start with the values cached before (and during) the condition
+                    cached = dict(self.cached)
                     self.create_assembly_code_from_commands(command[2])
                     self.code.append(f"JUMP finish")
                     else_start = len(self.code) + self.code_offset
+                    self.cached = cached
                     self.create_assembly_code_from_commands(command[3])
+                    self.forget_cached()
                     command_end = len(self.code) + self.code_offset
-                    self.code[else_start - self.code_offset - 1] = self.code[else_start - self.code_offset - 1].replace('finish',
-                                                                                  str(command_end))
-                    for i in range(condition_start - self.code_offset, if_start - self.code_offset):
-                        self.code[i] = self.code[i].replace('finish', str(else_start))
+                    self.resolve_label(else_start - 1, else_start, 'finish', command_end)
+                    self.resolve_label(condition_start, if_start, 'finish', else_start)
 
                 self.is_in_loop = False
 
@@ -182,34 +248,58 @@ class Encoder:
                 command[0] - keyword
                 command[1] - condition
                 command[2] - commands inside 'while'
-                command[3] - constants
                 """
                 lines_scope = self.find_lines_scope('WHILE')
                 if lines_scope is None:
                     self.find_command_lineno("WHILE")
                 else:
                     modify_global_command_lineno(lines_scope[0])
+                    self.mark_line()
+                loop_line = get_global_command_lineno()
+                loop_code_start = len(self.code) + self.code_offset
                 self.is_in_loop = True
                 condition = self.simplify_condition(command[1])
                 if isinstance(condition, bool):
                     # If condition is met, do commands inside while and come back
                     if condition:
-                        self.prepare_consts_before_block(command[-1])
                         loop_start = len(self.code) + self.code_offset
+                        self.forget_cached()
                         self.create_assembly_code_from_commands(command[2])
                         self.code.append(f"JUMP {loop_start}")
                 else:
-                    self.prepare_consts_before_block(command[-1])
-                    condition_start = len(self.code) + self.code_offset
-                    self.check_condition(command[1])
-                    loop_start = len(self.code) + self.code_offset
-                    self.create_assembly_code_from_commands(command[2])
-                    self.code.append(f"JUMP {condition_start}")
-                    loop_end = len(self.code) + self.code_offset
-                    for i in range(condition_start - self.code_offset, loop_start - self.code_offset):
-                        self.code[i] = self.code[i].replace('finish', str(loop_end))
+                    self.create_loop(command[1], lambda: self.create_assembly_code_from_commands(command[2]))
 
                 self.is_in_loop = False
+                table = get_debug_table()
+                if table is not None:
+                    table.add_loop(loop_code_start, len(self.code) + self.code_offset, loop_line)
+
+            elif command[0] == "unrolled":
+                """
+                command[0] - keyword
+                command[1] - commands added by the compiler (done first)
+                command[2] - condition of repeating the copies (None if they are done once)
+                command[3] - copies of the body of the original 'while'
+                command[4] - the rest of the loop (another 'unrolled' command or None)
+                """
+                lines_scope = self.find_lines_scope('WHILE')
+                if lines_scope is None:
+                    self.find_command_lineno("WHILE")
+                else:
+                    modify_global_command_lineno(lines_scope[0])
+                    self.mark_line()
+                loop_line = get_global_command_lineno()
+                loop_code_start = len(self.code) + self.code_offset
+                self.is_in_loop = True
+                self.create_unrolled_code(command, get_global_command_lineno())
+                # The lines of the loop are done (even if no copy of the body was left)
+                if lines_scope is not None:
+                    modify_global_command_lineno(lines_scope[1])
+                self.is_in_loop = False
+                # Only the loops that still repeat (the ones unrolled completely are done once)
+                table = get_debug_table()
+                if table is not None and command[2] is not None:
+                    table.add_loop(loop_code_start, len(self.code) + self.code_offset, loop_line)
 
             elif command[0] == "until":
                 """
@@ -222,16 +312,30 @@ class Encoder:
                     self.find_command_lineno("REPEAT")
                 else:
                     modify_global_command_lineno(lines_scope[0])
+                    self.mark_line()
+                loop_line = get_global_command_lineno()
                 self.is_in_loop = True
                 loop_start = len(self.code) + self.code_offset
+                self.forget_cached()
                 self.create_assembly_code_from_commands(command[2])
                 condition_start = len(self.code) + self.code_offset
                 self.check_condition(command[1])
                 condition_end = len(self.code) + self.code_offset
-                for i in range(condition_start - self.code_offset, condition_end - self.code_offset):
-                    self.code[i] = self.code[i].replace('finish', str(loop_start))
+                self.resolve_label(condition_start, condition_end, 'finish', loop_start)
 
                 self.is_in_loop = False
+                table = get_debug_table()
+                if table is not None:
+                    table.add_loop(loop_start, condition_end, loop_line)
+
+            elif command[0] == "folded":
+                """
+                command[0] - keyword
+                command[1] - original commands (already done by the compiler)
+                command[2] - numbers written by them
+                command[3] - memory cells set by them (the ones used afterwards) along with their values
+                """
+                self.create_folded_code(command)
 
             elif command[0] == "proc_call":
                 """
@@ -244,11 +348,7 @@ class Encoder:
                 args = command[1][1]
 
                 # Find which procedure's encoder is called
-                received_encoder = None
-                for encoder in self.earlier_encoders:
-                    if encoder.symbols.name == command[1][0]:
-                        received_encoder = encoder
-                        break
+                received_encoder = self.procedures.get(command[1][0])
 
                 if received_encoder is None:
                     raise Exception(f"Procedure {command[1]} not found (line {get_global_command_lineno()})!")
@@ -277,12 +377,30 @@ class Encoder:
                         caller_arg_address = received_var.memory_offset
                         received_encoder.symbols.set_args_variable_address(i, caller_arg_address)
 
+                if get_debug_table() is not None:
+                    received_encoder.argument_owners = {arg: self.symbol_owner(name) for arg, name in
+                                                        zip(received_encoder.symbols.args, args)}
+
                 current_line = get_global_command_lineno()
                 modify_global_command_lineno(received_encoder.lineno_offset)
                 self.find_command_lineno('IN')
-                # Getting current code length, so the procedure knows where to jump back
-                received_encoder.code_offset = len(self.code) + self.code_offset
-                received_encoder.create_assembly_code()
+                # The procedure is encoded as a fragment starting at 0 (it is moved to its place when it is linked),
+                # with its own debug table
+                received_encoder.code_offset = 0
+                table = get_debug_table()
+                if table is not None:
+                    modify_debug_table(type(table)())
+                # Reusing the procedure's code if it was already encoded in the same state
+                procedure_cache = get_procedure_cache()
+                try:
+                    with measure("encode", received_encoder.symbols.name):
+                        if procedure_cache is None:
+                            received_encoder.create_assembly_code()
+                        else:
+                            procedure_cache.create_assembly_code(received_encoder)
+                finally:
+                    fragment_table = get_debug_table()
+                    modify_debug_table(table)
                 modify_global_command_lineno(current_line)
 
                 # Initializing any symbols that had been uninitialized but were initialized elsewhere
@@ -293,31 +411,105 @@ class Encoder:
                             var.initialized = True
 
                 # Procedure's generated code is appended to the current code
-                for line in received_encoder.code:
-                    self.code.append(line)
+                with measure("link"):
+                    self.link_fragment(received_encoder.code, fragment_table)
+                self.mark_line()
+                stats = get_compiler_stats()
+                if stats is not None:
+                    stats.add_inline_expansion(received_encoder.symbols.name, len(received_encoder.code))
 
                 # Procedure's generated code is erased
                 if received_encoder.is_procedure:
                     received_encoder.code = []
+                # The procedure uses the cache registers as well
+                self.forget_cached()
+
+            # After a top-level command all its jumps are resolved, so its code can be written
+            if top_level:
+                self.flush_code()
+        self.hints = outer_hints
 
     """
     Function responsible for creating a number in the given register
     """
     def create_const(self, const, reg='a'):
         self.code.append(f"RST {reg}")
-        if const > 0:
-            # Removing '0b' part
-            bits = bin(const)[2:]
-            # Iterating over the bits except the last one
-            for bit in bits[:-1]:
-                # Increment by one
-                if bit == '1':
-                    self.code.append(f"INC {reg}")
-                # Multiply by two using left shift
-                self.code.append(f"SHL {reg}")
-            # Checking the last bit
-            if bits[-1] == '1':
-                self.code.append(f"INC {reg}")
+        # The shortest sequence of INC, DEC and SHL (only this register is changed)
+        for letter in const_sequence(const):
+            self.code.append(f"{INSTRUCTIONS[letter]} {reg}")
+
+    """
+    Function responsible for calculating the expression straight in 'a' (the arithmetic works only through 'a',
+    so in most cases the result does not have to be moved between the registers). The other registers are used
+    from 'first_reg' on. The forms it cannot do better fall back to 'calculate_expression'.
+    """
+    def calculate_expression_to_acc(self, expression, first_reg='b', second_reg='c', third_reg='d'):
+        if expression[0] == "const":
+            self.create_const(expression[1], 'a')
+            return
+        elif expression[0] == "load":
+            self.calculate_expression(expression, 'a', first_reg)
+            return
+
+        if expression[1][0] == 'const':
+            const, var = 1, 2
+        elif expression[2][0] == 'const':
+            const, var = 2, 1
+        else:
+            const = None
+
+        if expression[1][0] == expression[2][0] == "const" and expression[0] in ("add", "sub", "mul"):
+            if expression[0] == "add":
+                self.create_const(expression[1][1] + expression[2][1], 'a')
+            elif expression[0] == "sub":
+                self.create_const(max(0, expression[1][1] - expression[2][1]), 'a')
+            else:
+                self.create_const(expression[1][1] * expression[2][1], 'a')
+
+        elif expression[0] == "add":
+            if expression[1] == expression[2]:
+                self.calculate_expression_to_acc(expression[1], first_reg, second_reg)
+                self.code.append("SHL a")
+            elif const and expression[const][1] < 14:
+                self.calculate_expression_to_acc(expression[var], first_reg, second_reg)
+                self.code += expression[const][1] * ["INC a"]
+            else:
+                self.calculate_expression(expression[1], first_reg, second_reg)
+                self.calculate_expression_to_acc(expression[2], second_reg, third_reg)
+                self.code.append(f"ADD {first_reg}")
+
+        elif expression[0] == "sub":
+            if expression[1] == expression[2] or (const == 1 and expression[const][1] == 0):
+                self.code.append("RST a")
+            elif const == 2 and expression[const][1] < 14:
+                self.calculate_expression_to_acc(expression[var], first_reg, second_reg)
+                self.code += expression[const][1] * ["DEC a"]
+            else:
+                self.calculate_expression(expression[1], first_reg, third_reg)
+                self.calculate_expression(expression[2], second_reg, third_reg)
+                self.code.append(f"GET {first_reg}")
+                self.code.append(f"SUB {second_reg}")
+
+        # Multiplying by a constant with shifts and additions (the sum is already in 'a')
+        elif expression[0] == "mul" and const and expression[const][1] & (expression[const][1] - 1) != 0 and \
+                self.is_shift_add_cheaper(expression, var, expression[const][1]):
+            self.calculate_expression(expression[var], first_reg, second_reg)
+            self.multiply_by_constant(expression[const][1], 'a', first_reg)
+
+        # Multiplying and dividing by zero or a power of two (only shifts are needed)
+        elif expression[0] in ("mul", "div") and (const == 2 or (const == 1 and expression[0] == "mul")) and \
+                expression[const][1] & (expression[const][1] - 1) == 0:
+            val = expression[const][1]
+            if val == 0:
+                self.code.append("RST a")
+            else:
+                self.calculate_expression_to_acc(expression[var], first_reg, second_reg)
+                shift = "SHL a" if expression[0] == "mul" else "SHR a"
+                self.code += (val.bit_length() - 1) * [shift]
+
+        else:
+            self.calculate_expression(expression, first_reg, second_reg, third_reg)
+            self.code.append(f"GET {first_reg}")
 
     """
     Function responsible for calculating expression's value
@@ -449,6 +641,11 @@ class Encoder:
                             self.code.append(f"SHL {target_reg}")
                             val /= 2
                         return
+                    # Adding the shifted other part for every set bit of the constant (if it is cheaper than the loop)
+                    elif self.is_shift_add_cheaper(expression, var, val):
+                        self.calculate_expression(expression[var], second_reg, target_reg)
+                        self.multiply_by_constant(val, target_reg, second_reg)
+                        return
 
                 # If both parts are equal to each other, calculate just one of them
                 if expression[1] == expression[2]:
@@ -458,80 +655,7 @@ class Encoder:
                 else:
                     self.calculate_expression(expression[1], second_reg, target_reg)
                     self.calculate_expression(expression[2], third_reg, target_reg)
-
-                # Check if there is multiplication by zero
-                self.code.append(f"GET {second_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 42}")
-                self.code.append(f"GET {third_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 40}")
-
-                # Check which number is bigger
-                self.code.append(f"GET {second_reg}")
-                self.code.append(f"SUB {third_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 19}")
-
-                # Second is bigger than third
-                # Check if the third is already zero
-                self.code.append(f"RST {target_reg}")
-                self.code.append(f"GET {third_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 35}")
-
-                # Check if third is odd (using shifts)
-                self.code.append(f"PUT {fifth_reg}")
-                self.code.append(f"SHR {third_reg}")
-                self.code.append(f"SHL {third_reg}")
-                self.code.append(f"SUB {third_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JPOS {k + 2} ")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JUMP {k + 4}")
-                # If it is odd (shifts cannot be used)
-                self.code.append(f"GET {target_reg}")
-                self.code.append(f"ADD {second_reg}")
-                self.code.append(f"PUT {target_reg}")
-                # If it is even (shifts can be used)
-                self.code.append(f"GET {fifth_reg}")  # Retrieve previously shifted third
-                self.code.append(f"PUT {third_reg}")  # Put it back in the right register
-                self.code.append(f"SHR {third_reg}")  # Divide the third by two
-                self.code.append(f"SHL {second_reg}")  # Multiply the second by two
-                self.code.append(f"RST a")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JUMP {k - 16}")
-
-                # Third is bigger than second
-                # Check if the second is already zero
-                self.code.append(f"RST {target_reg}")
-                self.code.append(f"GET {second_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 17}")
-
-                # Check if second is odd (using shifts)
-                self.code.append(f"PUT {fifth_reg}")
-                self.code.append(f"SHR {second_reg}")
-                self.code.append(f"SHL {second_reg}")
-                self.code.append(f"SUB {second_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JPOS {k + 2}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JUMP {k + 4}")
-                # If it is odd (shifts cannot be used)
-                self.code.append(f"GET {target_reg}")
-                self.code.append(f"ADD {third_reg}")
-                self.code.append(f"PUT {target_reg}")
-                # If it is even (shifts can be used)
-                self.code.append(f"GET {fifth_reg}")  # Retrieve previously shifted second
-                self.code.append(f"PUT {second_reg}")  # Put it back in the right register
-                self.code.append(f"SHR {second_reg}")  # Divide the second by two
-                self.code.append(f"SHL {third_reg}")  # Multiply the third by two
-                self.code.append(f"RST a")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JUMP {k - 16}")
-                # If there was multiplication by zero
-                self.code.append(f"RST {target_reg}")
+                self.perform_multiplication(expression, target_reg, second_reg, third_reg, fifth_reg)
 
             # Dividing two numbers
             elif expression[0] == "div":
@@ -585,7 +709,7 @@ class Encoder:
                 self.calculate_expression(expression[1], third_reg, second_reg)
                 self.calculate_expression(expression[2], fourth_reg, second_reg)
                 # Performing division
-                self.perform_division(target_reg, second_reg, third_reg, fourth_reg)
+                self.divide(expression, target_reg, second_reg, third_reg, fourth_reg)
 
             elif expression[0] == "mod":
                 if expression[1][0] == expression[2][0] == "const":
@@ -624,18 +748,283 @@ class Encoder:
 
                 self.calculate_expression(expression[1], third_reg, second_reg)
                 self.calculate_expression(expression[2], fourth_reg, second_reg)
-                self.perform_division(second_reg, target_reg, third_reg, fourth_reg)
+                self.divide(expression, second_reg, target_reg, third_reg, fourth_reg)
+
+    """
+    Function responsible for creating a rotated loop: the condition is checked once before the loop and then at the end
+    of every iteration, which jumps back only if the condition is still met (no extra jump per iteration)
+    """
+    def create_loop(self, condition, create_body, show_warnings=True):
+        line = get_global_command_lineno()
+        condition_start = len(self.code) + self.code_offset
+        with hidden_warnings(not show_warnings):
+            self.check_condition(condition)
+        loop_start = len(self.code) + self.code_offset
+        # Every iteration after the first one starts at the end of the previous one
+        self.forget_cached()
+        create_body()
+        repeat_start = len(self.code) + self.code_offset
+        self.mark_line(line)
+        # The warnings for the condition were already shown when it was checked before the loop
+        with hidden_warnings():
+            self.check_condition(condition, jump_if_true=True)
+        loop_end = len(self.code) + self.code_offset
+        self.resolve_label(condition_start, loop_start, 'finish', loop_end)
+        self.resolve_label(repeat_start, loop_end, 'finish', loop_start)
+        self.forget_cached()
+
+    """
+    Function responsible for creating the code of an unrolled loop. Every copy of the body is encoded from the line
+    of the loop (so the lines of its commands are found again) and only the first one shows the warnings.
+    """
+    def create_unrolled_code(self, command, line, show_warnings=True):
+        _, setup, condition, copies, rest = command
+        # The commands added by the compiler have no lines of their own
+        with hidden_warnings():
+            for generated in setup:
+                self.create_assembly_code_from_commands([generated])
+                modify_global_command_lineno(line)
+
+        def create_copies():
+            for i, copy in enumerate(copies):
+                modify_global_command_lineno(line)
+                with hidden_warnings(not show_warnings or i > 0):
+                    self.create_assembly_code_from_commands(copy)
+
+        if condition is None:
+            create_copies()
+        else:
+            self.create_loop(condition, create_copies, show_warnings)
+        if rest is not None:
+            self.create_unrolled_code(rest, line, False)
+
+    """
+    Function responsible for creating the code of the commands done at the compile time. The original commands are
+    still encoded (for their errors, warnings and lines), but their code is dropped. Then the numbers are written and
+    the memory cells are set (in the order of their addresses, so the next address is often just one more than the
+    previous one).
+    """
+    def create_folded_code(self, command):
+        code_length = len(self.code)
+        self.create_assembly_code_from_commands(command[1])
+        del self.code[code_length:]
+        table = get_debug_table()
+        if table is not None:
+            table.drop(len(self.code) + self.code_offset)
+            self.mark_line()
+        self.forget_cached()
+
+        for value in command[2]:
+            self.create_const(value, 'a')
+            self.code.append("WRITE")
+
+        cells = [(self.symbols.get_address(identifier if type(identifier) == str else identifier[1:]), value)
+                 for identifier, value in command[3]]
+        previous_address = None
+        for address, value in sorted(cells):
+            if previous_address is not None and address == previous_address + 1:
+                self.code.append("INC b")
+            else:
+                self.create_const(address, 'b')
+            self.create_const(value, 'a')
+            self.code.append("STORE b")
+            previous_address = address
+
+    # Ranges of the operands of the multiplication, division or remainder (unknown if it was not analyzed)
+    def operand_ranges(self, expression):
+        return self.ranges.get(id(expression), (UNKNOWN, UNKNOWN))
+
+    """
+    Tells if multiplying by the constant with shifts and additions (SHL for every bit, ADD for every set one) costs
+    less than the worst case of the multiplication loop, which goes through the bits of the smaller operand.
+    """
+    def is_shift_add_cheaper(self, expression, var, val):
+        other = self.operand_ranges(expression)[var - 1]
+        bits = val.bit_length() if other[1] is None else min(val, other[1]).bit_length()
+        shift_add_cost = val.bit_length() + 5 * (bin(val).count("1") - 1) + 1
+        return shift_add_cost <= MULTIPLICATION_CHECKS_COST + MULTIPLICATION_BIT_COST * bits
+
+    # The result is summed up in 'a' while the other part (in the register) is shifted to the next set bit
+    def multiply_by_constant(self, val, target_reg, register):
+        first = True
+        while val > 0:
+            if val & 1:
+                self.code.append(f"GET {register}" if first else f"ADD {register}")
+                first = False
+            val >>= 1
+            if val > 0:
+                self.code.append(f"SHL {register}")
+        if target_reg != 'a':
+            self.code.append(f"PUT {target_reg}")
+
+    """
+    Function responsible for multiplying the numbers in the registers (both of them are changed). The smaller number
+    is the counter, and the ranges of the operands leave out the checks that cannot fail: an operand that is never
+    bigger than the other one is the counter without comparing them first, the counter with few bits (the smaller
+    operand has at most as many bits as the one with the lower bound) is gone through in a fixed number of unrolled
+    steps, and the checks for zero are left out for the operands that are never zero.
+    """
+    def perform_multiplication(self, expression, target_reg, second_reg, third_reg, scratch_reg):
+        first, second = self.operand_ranges(expression)
+        start = len(self.code) + self.code_offset
+        bits = [b for b in (bit_length(first), bit_length(second)) if b is not None]
+        steps = min(bits) if bits and min(bits) <= MAX_UNROLLED_BITS else None
+
+        if first[1] is not None and first[1] <= second[0]:
+            self.multiply_by_counter(target_reg, second_reg, third_reg, scratch_reg, steps)
+        elif second[1] is not None and second[1] <= first[0]:
+            self.multiply_by_counter(target_reg, third_reg, second_reg, scratch_reg, steps)
+        else:
+            # Check if there is multiplication by zero
+            checks = [register for register, bounds in ((second_reg, first), (third_reg, second))
+                      if not is_nonzero(bounds)]
+            for register in checks:
+                self.code.append(f"GET {register}")
+                self.code.append("JZERO product_zero")
+
+            # Check which number is bigger
+            self.code.append(f"GET {second_reg}")
+            self.code.append(f"SUB {third_reg}")
+            k = len(self.code) + self.code_offset
+            self.code.append("JZERO product_second")
+
+            # Second is bigger than third
+            self.multiply_by_counter(target_reg, third_reg, second_reg, scratch_reg, steps)
+            if steps is not None:
+                # The unrolled steps do not jump back, so the last one goes on to the end
+                self.code.append("JUMP product_end")
+            # Third is bigger than second
+            product_second = len(self.code) + self.code_offset
+            self.resolve_label(k, product_second, 'product_second', product_second)
+            self.multiply_by_counter(target_reg, second_reg, third_reg, scratch_reg, steps)
+            if checks:
+                if steps is not None:
+                    self.code.append("JUMP product_end")
+                # If there was multiplication by zero
+                product_zero = len(self.code) + self.code_offset
+                self.code.append(f"RST {target_reg}")
+                self.resolve_label(start, product_zero, 'product_zero', product_zero)
+        end = len(self.code) + self.code_offset
+        self.resolve_label(start, end, 'product_end', end)
+
+    # The loop or the given number of unrolled steps (if it is not None)
+    def multiply_by_counter(self, target_reg, counter_reg, other_reg, scratch_reg, steps):
+        if steps is None:
+            self.multiplication_loop(target_reg, counter_reg, other_reg, scratch_reg)
+        else:
+            self.unrolled_multiplication(target_reg, counter_reg, other_reg, steps)
+
+    # Adding the other number for every set bit of the counter (from the lowest one), as long as the counter is not zero
+    def multiplication_loop(self, target_reg, counter_reg, other_reg, scratch_reg):
+        # Check if the counter is already zero
+        self.code.append(f"RST {target_reg}")
+        self.code.append(f"GET {counter_reg}")
+        self.code.append("JZERO product_end")
+
+        # Check if the counter is odd (using shifts)
+        self.code.append(f"PUT {scratch_reg}")
+        self.code.append(f"SHR {counter_reg}")
+        self.code.append(f"SHL {counter_reg}")
+        self.code.append(f"SUB {counter_reg}")
+        k = len(self.code) + self.code_offset
+        self.code.append(f"JPOS {k + 2}")
+        k = len(self.code) + self.code_offset
+        self.code.append(f"JUMP {k + 4}")
+        # If it is odd (shifts cannot be used)
+        self.code.append(f"GET {target_reg}")
+        self.code.append(f"ADD {other_reg}")
+        self.code.append(f"PUT {target_reg}")
+        # If it is even (shifts can be used)
+        self.code.append(f"GET {scratch_reg}")  # Retrieve previously shifted counter
+        self.code.append(f"PUT {counter_reg}")  # Put it back in the right register
+        self.code.append(f"SHR {counter_reg}")  # Divide the counter by two
+        self.code.append(f"SHL {other_reg}")  # Multiply the other number by two
+        self.code.append(f"RST a")
+        k = len(self.code) + self.code_offset
+        self.code.append(f"JUMP {k - 16}")
+
+    # The same as the loop for a counter that has at most the given number of bits (one step per bit, no jump back)
+    def unrolled_multiplication(self, target_reg, counter_reg, other_reg, bits):
+        self.code.append(f"RST {target_reg}")
+        for i in range(bits):
+            self.code.append(f"GET {counter_reg}")
+            self.code.append("JZERO product_end")
+            # The lowest bit of the counter is left in 'a' and the counter is divided by two
+            self.code.append(f"SHR {counter_reg}")
+            self.code.append(f"SHL {counter_reg}")
+            self.code.append(f"SUB {counter_reg}")
+            self.code.append(f"SHR {counter_reg}")
+            k = len(self.code) + self.code_offset
+            self.code.append(f"JZERO {k + 4}")
+            self.code.append(f"GET {target_reg}")
+            self.code.append(f"ADD {other_reg}")
+            self.code.append(f"PUT {target_reg}")
+            if i < bits - 1:
+                self.code.append(f"SHL {other_reg}")
+
+    """
+    Function responsible for dividing the numbers in the registers with the code chosen by the ranges of the operands:
+    a dividend that is always smaller than the divisor is the remainder itself, a divisor of a known value (when the
+    quotient has few bits) is subtracted in a fixed number of unrolled steps, and the divisor that is never zero is
+    not checked.
+    """
+    def divide(self, expression, quotient_register, remainder_register, dividend_register, divisor_register):
+        dividend, divisor = self.operand_ranges(expression)
+        if dividend[1] is not None and dividend[1] < divisor[0]:
+            self.code.append(f"RST {quotient_register}")
+            self.code.append(f"GET {dividend_register}")
+            self.code.append(f"PUT {remainder_register}")
+            return
+        if divisor[0] == divisor[1] and divisor[0] > 0 and dividend[1] is not None:
+            steps = dividend[1].bit_length() - divisor[0].bit_length() + 1
+            if steps <= MAX_UNROLLED_BITS:
+                self.unrolled_division(quotient_register, remainder_register, dividend_register, divisor_register,
+                                       steps)
+                return
+        self.perform_division(quotient_register, remainder_register, dividend_register, divisor_register,
+                              not is_nonzero(divisor))
+
+    """
+    Division in which the quotient has at most 'steps' bits: the divisor is shifted to the highest one and subtracted
+    from the remainder wherever it fits, going down by one bit per step. A dividend smaller than the divisor (often
+    far below its highest value) skips all the steps.
+    """
+    def unrolled_division(self, quotient_register, remainder_register, dividend_register, divisor_register, steps):
+        start = len(self.code) + self.code_offset
+        self.code.append(f"RST {quotient_register}")
+        self.code.append(f"GET {dividend_register}")
+        self.code.append(f"PUT {remainder_register}")
+        self.code.append(f"GET {divisor_register}")
+        self.code.append(f"SUB {remainder_register}")
+        self.code.append("JPOS quotient_end")
+        self.code += (steps - 1) * [f"SHL {divisor_register}"]
+        for i in range(steps):
+            if i > 0:
+                self.code.append(f"SHL {quotient_register}")
+                self.code.append(f"SHR {divisor_register}")
+            # If the shifted divisor is bigger than the remainder, this bit of the quotient is zero
+            self.code.append(f"GET {divisor_register}")
+            self.code.append(f"SUB {remainder_register}")
+            k = len(self.code) + self.code_offset
+            self.code.append(f"JPOS {k + 5}")
+            self.code.append(f"GET {remainder_register}")
+            self.code.append(f"SUB {divisor_register}")
+            self.code.append(f"PUT {remainder_register}")
+            self.code.append(f"INC {quotient_register}")
+        end = len(self.code) + self.code_offset
+        self.resolve_label(start, end, 'quotient_end', end)
 
     def perform_division(self, quotient_register='b', remainder_register='c', dividend_register='d',
-                         divisor_register='e'):
+                         divisor_register='e', check_divisor=True):
 
         # Reset quotient's and remainder's registers
         start = len(self.code) + self.code_offset
         self.code.append(f"RST {quotient_register}")
         self.code.append(f"RST {remainder_register}")
-        self.code.append(f"GET {divisor_register}")
-        # Check if the divisor is equal to zero, if yes, end the division
-        self.code.append(f"JZERO finish")
+        # Check if the divisor is equal to zero, if yes, end the division (unless it is never zero)
+        if check_divisor:
+            self.code.append(f"GET {divisor_register}")
+            self.code.append(f"JZERO finish")
         # Add the dividend to the remainder
         self.code.append(f"GET {remainder_register}")
         self.code.append(f"ADD {dividend_register}")
@@ -701,10 +1090,39 @@ class Encoder:
         self.code.append(f"JUMP midblock_start")
         end = len(self.code) + self.code_offset
 
-        for i in range(start- self.code_offset, end- self.code_offset):
-            self.code[i] = self.code[i].replace('midblock_start', str(midblock_start))
-            self.code[i] = self.code[i].replace('block_start', str(block_start))
-            self.code[i] = self.code[i].replace('finish', str(end))
+        self.resolve_label(start, end, 'midblock_start', midblock_start)
+        self.resolve_label(start, end, 'block_start', block_start)
+        self.resolve_label(start, end, 'finish', end)
+
+    # Jumps to other jumps go straight to their final destination (only inside the code that is not written yet)
+    def thread_jumps(self):
+        with measure("link"):
+            end = len(self.code) + self.code_offset
+            for i, line in enumerate(self.code):
+                parts = line.split()
+                if parts[0] not in JUMPS:
+                    continue
+                target = int(parts[1])
+                visited = set()
+                while self.code_offset <= target < end and target not in visited:
+                    visited.add(target)
+                    next_parts = self.code[target - self.code_offset].split()
+                    # Unconditional jump or the same conditional jump (register 'a' is not changed by the jumps)
+                    if next_parts[0] == "JUMP" or next_parts[0] == parts[0]:
+                        target = int(next_parts[1])
+                    # JZERO jumping to JPOS (and the other way round) never jumps again
+                    elif parts[0] != "JUMP" and next_parts[0] in JUMPS and next_parts[0] != "JUMP":
+                        target += 1
+                    else:
+                        break
+                if target != int(parts[1]):
+                    self.code[i] = f"{parts[0]} {target}"
+
+    # Replacing the label with the address in the code between start and end
+    def resolve_label(self, start, end, label, address):
+        with measure("link"):
+            for i in range(start - self.code_offset, end - self.code_offset):
+                self.code[i] = self.code[i].replace(label, str(address))
 
     def simplify_condition(self, condition):
         # If the condition is based on two constants, return the results as a boolean
@@ -752,63 +1170,64 @@ class Encoder:
         else:
             return condition
 
-    def check_condition(self, condition, first_reg='b', second_reg='c', third_reg='d'):
+    """
+    Function responsible for checking the condition, the code jumps to 'finish' if the condition is not met
+    (or if it is met, when jump_if_true is set) and goes on to the next instruction otherwise
+    """
+    def check_condition(self, condition, first_reg='b', second_reg='c', third_reg='d', jump_if_true=False):
+        # Jumping when the condition is met is the same as jumping when the opposite one is not met
+        if jump_if_true:
+            condition = (NEGATED_CONDITIONS[condition[0]], condition[1], condition[2])
+
         # If in the condition 0 is the first argument
         if condition[1][0] == "const" and condition[1][1] == 0:
             # 0 >= ... or 0 == ...
             if condition[0] == "ge" or condition[0] == "eq":
-                # If the expression is equal to zero, don't skip
-                self.calculate_expression(condition[2], first_reg, second_reg)
-                self.code.append(f"GET {first_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 2}")
-                self.code.append("JUMP finish")
+                # If the expression is bigger than zero, skip the part
+                self.calculate_expression_to_acc(condition[2], first_reg, second_reg)
+                self.code.append("JPOS finish")
 
             # 0 < ... or 0 != ...
             elif condition[0] == "lt" or condition[0] == "ne":
                 # If the expression is equal to zero, skip the part
-                self.calculate_expression(condition[2], first_reg, second_reg)
-                self.code.append(f"GET {first_reg}")
+                self.calculate_expression_to_acc(condition[2], first_reg, second_reg)
                 self.code.append(f"JZERO finish")
 
+            # 0 <= ... is always met, 0 > ... never is
+            elif condition[0] == "gt":
+                self.code.append("JUMP finish")
+
         # If in the condition 0 is the second argument
         elif condition[2][0] == "const" and condition[2][1] == 0:
             if condition[0] == "le" or condition[0] == "eq":
-                self.calculate_expression(condition[1], first_reg, second_reg)
-                self.code.append(f"GET {first_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 2}")
-                self.code.append("JUMP finish")
+                self.calculate_expression_to_acc(condition[1], first_reg, second_reg)
+                self.code.append("JPOS finish")
 
             elif condition[0] == "gt" or condition[0] == "ne":
-                self.calculate_expression(condition[1], first_reg, second_reg)
-                self.code.append(f"GET {first_reg}")
+                self.calculate_expression_to_acc(condition[1], first_reg, second_reg)
                 self.code.append(f"JZERO finish")
 
+            elif condition[0] == "lt":
+                self.code.append("JUMP finish")
+
+        # y - x is calculated with y straight in 'a'
+        elif condition[0] in ("ge", "lt"):
+            self.calculate_expression(condition[1], first_reg, third_reg)
+            self.calculate_expression_to_acc(condition[2], second_reg, third_reg)
+            self.code.append(f"SUB {first_reg}")
+            # x >= y is not met if y - x > 0, x < y is not met if y - x == 0
+            self.code.append("JPOS finish" if condition[0] == "ge" else "JZERO finish")
+
         else:
             # Calculate both parts of the condition
             self.calculate_expression(condition[1], first_reg, third_reg)
             self.calculate_expression(condition[2], second_reg, third_reg)
 
+            # x <= y is not met if x - y > 0
             if condition[0] == "le":
                 self.code.append(f"GET {first_reg}")
                 self.code.append(f"SUB {second_reg}")
-                self.code.append(f"PUT {first_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 2}")
-                self.code.append(f"JUMP finish")
-
-            elif condition[0] == "ge":
-                self.code.append(f"GET {second_reg}")
-                self.code.append(f"SUB {first_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 2}")
-                self.code.append(f"JUMP finish")
-
-            elif condition[0] == "lt":
-                self.code.append(f"GET {second_reg}")
-                self.code.append(f"SUB {first_reg}")
-                self.code.append(f"JZERO finish")
+                self.code.append(f"JPOS finish")
 
             elif condition[0] == "gt":
                 self.code.append(f"GET {first_reg}")
@@ -819,82 +1238,136 @@ class Encoder:
                 # Checking x - y and y - x
                 self.code.append(f"GET {first_reg}")
                 self.code.append(f"SUB {second_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 2}")
-                self.code.append(f"JUMP finish")
+                self.code.append(f"JPOS finish")
                 self.code.append(f"GET {second_reg}")
                 self.code.append(f"SUB {first_reg}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 2}")
-                self.code.append(f"JUMP finish")
+                self.code.append(f"JPOS finish")
 
             elif condition[0] == "ne":
                 # Checking x - y and y - x
                 self.code.append(f"GET {first_reg}")
                 self.code.append(f"SUB {second_reg}")
                 k = len(self.code) + self.code_offset
-                self.code.append(f"JZERO {k + 2}")
-                k = len(self.code) + self.code_offset
-                self.code.append(f"JUMP {k + 4}")
+                self.code.append(f"JPOS {k + 4}")
                 self.code.append(f"GET {second_reg}")
                 self.code.append(f"SUB {first_reg}")
                 self.code.append(f"JZERO finish")
 
     def load_array_at(self, array, index, reg1, reg2):
+        if self.load_cached(("array", array, index), reg1):
+            self.check_array_index(array, index)
+            return
         self.load_array_address_at(array, index, reg1, reg2)
         self.code.append(f"LOAD {reg1}")
-        self.code.append(f"PUT {reg1}")
+        self.keep_cached(("array", array, index))
+        if reg1 != 'a':
+            self.code.append(f"PUT {reg1}")
+        self.set_accumulator(("array", array, index))
 
     def load_array_address_at(self, array, index, reg1, reg2):
+        self.check_array_index(array, index)
         # If the call is in the form of f[const]
         if type(index) == int:
             address = self.symbols.get_address((array, index))
             self.create_const(address, reg1)
         # If the call is in the form of f[x] (where x is a variable)
         elif type(index) == tuple:
-            # If in the f[x] the x is undeclared
-            if type(index[1]) == tuple:
-                self.load_variable(index[1][1], reg1, declared=False)
-            else:
-                # If in the f[x] the x is not initialized
-                if not self.symbols[index[1]].initialized:
-                    # Give just a warning if the variable is inside any kind of loop or if (it may be initialized elsewhere)
-                    if self.is_in_loop:
-                        print(f"WARNING: Variable {array} may not have been initialized (line {get_global_command_lineno()})!")
-                    else:
-                        raise Exception(f"Trying to use {array}({index[1]}) where variable {index[1]} is uninitialized (line {get_global_command_lineno()})!")
-                # If everything is fine - load the variable's address
-                self.load_variable(index[1], reg1)
+            # If everything is fine - load the variable's address
+            self.load_variable(index[1], reg1)
             # Get the address of the first element of the array and then add the variable's address
             var = self.symbols.get_variable(array)
             self.create_const(var.memory_offset, reg2)
-            self.code.append(f"GET {reg1}")
+            if reg1 != 'a':
+                self.code.append(f"GET {reg1}")
             self.code.append(f"ADD {reg2}")
-            self.code.append(f"PUT {reg1}")
+            if reg1 != 'a':
+                self.code.append(f"PUT {reg1}")
+        self.mark_access(array)
+
+    def check_array_index(self, array, index):
+        if type(index) == tuple:
+            # If in the f[x] the x is undeclared
+            if type(index[1]) == tuple:
+                raise Exception(f"Undeclared variable {index[1][1]} (line {get_global_command_lineno()})!")
+            # If in the f[x] the x is not initialized
+            elif not self.symbols[index[1]].initialized:
+                # Give just a warning if the variable is inside any kind of loop or if (it may be initialized elsewhere)
+                if self.is_in_loop:
+                    print(f"WARNING: Variable {array} may not have been initialized (line {get_global_command_lineno()})!")
+                else:
+                    raise Exception(f"Trying to use {array}({index[1]}) where variable {index[1]} is uninitialized (line {get_global_command_lineno()})!")
 
     def load_variable(self, name, reg, declared=True):
+        if declared and self.load_cached(name, reg):
+            return
         self.load_variable_address(name, reg, declared)
         self.code.append(f"LOAD {reg}")
-        self.code.append(f"PUT {reg}")
+        self.keep_cached(name)
+        if reg != 'a':
+            self.code.append(f"PUT {reg}")
+        self.set_accumulator(name)
+
+    # Getting the value from a cache register (if it is kept there)
+    def load_cached(self, value, reg):
+        if self.hints is not None:
+            self.hints.use(value)
+        # The value is still in 'a' (nothing was done since it got there)
+        if self.accumulator == (value, len(self.code) + self.code_offset):
+            if value not in self.cached.values():
+                self.keep_cached(value)
+            if reg != 'a':
+                self.code.append(f"PUT {reg}")
+            self.set_accumulator(value)
+            return True
+        for cache_reg, cached_value in self.cached.items():
+            if cached_value == value:
+                self.code.append(f"GET {cache_reg}")
+                if reg != 'a':
+                    self.code.append(f"PUT {reg}")
+                self.set_accumulator(value)
+                # Marking the value as the most recently used one
+                del self.cached[cache_reg]
+                self.cached[cache_reg] = value
+                return True
+        return False
+
+    # Keeping the value that is in 'a' in a cache register (if it is going to be loaded again)
+    def keep_cached(self, value):
+        if self.hints is None or not self.hints.loaded_again(value):
+            return
+        free = [reg for reg in CACHE_REGISTERS if reg not in self.cached]
+        cache_reg = free[0] if free else next(iter(self.cached))
+        self.cached.pop(cache_reg, None)
+        self.code.append(f"PUT {cache_reg}")
+        self.cached[cache_reg] = value
+
+    # Remembering that the value is in 'a' as long as no other instruction is added
+    def set_accumulator(self, value):
+        self.accumulator = (value, len(self.code) + self.code_offset)
+
+    # Forgetting all cached values (where the code can be reached from more than one place)
+    def forget_cached(self):
+        self.cached.clear()
+        self.accumulator = None
+
+    # Forgetting the cached values that storing to the target may change
+    def invalidate_cached(self, target):
+        name = target if type(target) == str else target[1]
+        # Arguments of a procedure may refer to the same variable (or array) of the caller
+        arguments = set(self.symbols.args) if self.is_procedure and name in self.symbols.args else set()
+        for cache_reg, value in list(self.cached.items()):
+            names = value_symbols(value)
+            if name in names or arguments.intersection(names):
+                del self.cached[cache_reg]
 
     def load_variable_address(self, name, reg, declared=True):
         if declared:
             address = self.symbols.get_address(name)
             self.create_const(address, reg)
+            self.mark_access(name)
         else:
             raise Exception(f"Undeclared variable {name} (line {get_global_command_lineno()})!")
 
-    # Add the constants inside the block to the symbols
-    def prepare_consts_before_block(self, consts, reg1='b', reg2='c'):
-        for c in consts:
-            address = self.symbols.get_const(c)
-            if address is None:
-                address = self.symbols.add_const(c)
-                self.create_const(address, reg1)
-                self.create_const(c, reg2)
-                self.code.append(f"GET {reg2}")
-                self.code.append(f"STORE {reg1}")
-
     # For if, if-else, while and repeat find its scope
     def find_lines_scope(self, command):
         end_statement = ""
@@ -903,23 +1376,47 @@ class Encoder:
         elif command == 'REPEAT':
             end_statement = "UNTIL"
 
-        for token in program_lines:
-            if token[0] == command and token[1] > get_global_command_lineno():
-                loop_start_lineno = token[1]
-                command_counter = 0
-                for tok in program_lines:
-                    if tok[1] > loop_start_lineno:
-                        if tok[0] == f"{end_statement}" and command_counter == 0:
-                            return [loop_start_lineno, tok[1]]
-                        if tok[0] == f"{end_statement}":
-                            command_counter -= 1
-                        if tok[0] == command:
-                            command_counter += 1
-                break
+        loop_start_lineno = next_program_line(command, get_global_command_lineno())
+        if loop_start_lineno is not None:
+            command_counter = 0
+            for tok in program_lines[program_lines_positions[loop_start_lineno] + 1:]:
+                if tok[0] == f"{end_statement}" and command_counter == 0:
+                    return [loop_start_lineno, tok[1]]
+                if tok[0] == f"{end_statement}":
+                    command_counter -= 1
+                if tok[0] == command:
+                    command_counter += 1
 
     # Finding where the command is regarding current program line
     def find_command_lineno(self, command):
-        for token in program_lines:
-            if token[0] == command and token[1] > get_global_command_lineno():
-                modify_global_command_lineno(token[1])
-                break
+        lineno = next_program_line(command, get_global_command_lineno())
+        if lineno is not None:
+            modify_global_command_lineno(lineno)
+        self.mark_line()
+
+    # The next instruction (if it is LOAD or STORE) accesses the symbol, if the debug table is written
+    def mark_access(self, name):
+        table = get_debug_table()
+        if table is not None:
+            table.add_access(len(self.code) + self.code_offset, *self.symbol_owner(name))
+
+    # Placing the code encoded from the address 0 (and its debug table) at the end of the current code
+    def link_fragment(self, fragment, fragment_table=None):
+        position = len(self.code) + self.code_offset
+        self.code.extend(relocate(fragment, position) if position else fragment)
+        if fragment_table is not None:
+            get_debug_table().extend(fragment_table, position)
+
+    # Procedure's name and the name of the symbol that has the memory of the given one (the arguments are the caller's)
+    def symbol_owner(self, name):
+        if name in self.argument_owners:
+            return self.argument_owners[name]
+        return self.symbols.name if self.is_procedure else "", name
+
+    # The code generated from now on comes from the line (the current one by default), if the debug table is written
+    def mark_line(self, lineno=None):
+        table = get_debug_table()
+        if table is not None:
+            table.add_line(len(self.code) + self.code_offset,
+                           get_global_command_lineno() if lineno is None else lineno,
+                           self.symbols.name if self.is_procedure else "")
@@ -0,0 +1,243 @@
+import argparse
+
+from simulator import COSTS, load_program
+from pgo import DebugTable
+
+# The loops added by the compiler (multiplication and division) go through the bits of a number (64-bit like in mw.cc)
+WORD_BITS = 64
+
+
+class EstimateError(Exception):
+    pass
+
+
+# Class responsible for a cost given as a sum of products of the loops' iteration counts
+class Cost:
+    """
+    Cost's attributes are:
+    - terms: coefficient of every product of the variables (a sorted tuple of their names, () for the constant part)
+    """
+    def __init__(self, terms=None):
+        self.terms = {product: value for product, value in (terms or {}).items() if value}
+
+    @staticmethod
+    def constant(value):
+        return Cost({(): value})
+
+    def __add__(self, other):
+        terms = dict(self.terms)
+        for product, value in other.terms.items():
+            terms[product] = terms.get(product, 0) + value
+        return Cost(terms)
+
+    def __eq__(self, other):
+        return self.terms == other.terms
+
+    def scaled(self, factor):
+        return Cost({product: value * factor for product, value in self.terms.items()})
+
+    # The cost repeated the given number of times
+    def times(self, variable):
+        return Cost({tuple(sorted(product + (variable,))): value for product, value in self.terms.items()})
+
+    # The larger of the costs for any values of the variables (the larger coefficient of every product)
+    def maximum(self, other):
+        terms = dict(self.terms)
+        for product, value in other.terms.items():
+            terms[product] = max(terms.get(product, 0), value)
+        return Cost(terms)
+
+    # Tells if the costs only differ by the products of the variables (e.g. by a loop that is skipped when it is
+    # done 0 times), so the maximum is still exact
+    def same_constant(self, other):
+        return self.terms.get((), 0) == other.terms.get((), 0) and \
+            (all(self.terms.get(p, 0) <= v for p, v in other.terms.items()) or
+             all(other.terms.get(p, 0) <= v for p, v in self.terms.items()))
+
+    def value(self, counts):
+        total = 0
+        for product, value in self.terms.items():
+            for variable in product:
+                value *= counts[variable]
+            total += value
+        return total
+
+    def __str__(self):
+        if not self.terms:
+            return "0"
+        parts = []
+        for product in sorted(self.terms, key=lambda p: (len(p), p)):
+            parts.append("*".join([str(self.terms[product])] + list(product)))
+        return " + ".join(parts)
+
+
+"""
+Class responsible for estimating the cost of a compiled program without running it (the costs of the instructions are
+the ones of the virtual machine, mw.cc). The code is split into loops by its backward jumps and every loop is reduced
+to a single step, from the innermost ones: the cost of one iteration is the most expensive path from the start of
+the loop to the backward jump. The loops of the source (found in the debug table) are repeated a symbolic number of
+times (one variable per loop in the code, so every inlined copy of a procedure has its own; an unrolled loop repeats
+a few iterations at once and the rest of them is another loop), the loops added by the compiler (for the
+multiplication and the division) at most WORD_BITS times per backward jump. The straight-line code is counted exactly;
+where the paths join after IF, the larger cost is taken, so the result is then the worst case.
+"""
+class CostEstimator:
+    """
+    CostEstimator's attributes are:
+    - program: list of instructions as (name, argument)
+    - loops: last instruction of every loop by its first instruction
+    - variables: name of the iteration count of every loop of the source (by its first instruction)
+    - descriptions: what every variable counts
+    - exact: whether the estimate is the exact cost (for the given iteration counts), not only its upper bound
+    """
+    def __init__(self, program, table=None):
+        self.program = program
+        self.loops = self.find_loops()
+        self.variables = {}
+        self.descriptions = {}
+        self.exact = True
+        self.name_loops(table)
+
+    def find_loops(self):
+        loops = {}
+        for i, (name, operand) in enumerate(self.program):
+            if name in ("JUMP", "JPOS", "JZERO") and operand <= i:
+                loops[operand] = max(loops.get(operand, i), i)
+        # The loops that overlap without one being inside the other are joined
+        changed = True
+        while changed:
+            changed = False
+            for start, end in sorted(loops.items()):
+                for other_start, other_end in sorted(loops.items()):
+                    if start < other_start <= end < other_end:
+                        loops[start] = other_end
+                        del loops[other_start]
+                        changed = True
+                        break
+                if changed:
+                    break
+        return loops
+
+    # The outermost loops of the code inside every loop of the debug table are the loops of the source
+    # (without the table every loop gets its variable)
+    def name_loops(self, table):
+        if table is None:
+            for start, end in sorted(self.loops.items()):
+                self.add_variable(start, f"repetitions of the loop at instructions {start}-{end}")
+            return
+        records = sorted(table.loops, key=lambda record: record[0])
+        for start, end in sorted(self.loops.items()):
+            containing = [record for record in records if record[0] <= start and end < record[1]]
+            if not containing:
+                continue
+            record = max(containing, key=lambda r: r[0])
+            if any(record[0] <= s < start and end <= e for s, e in self.loops.items() if (s, e) != (start, end)):
+                continue
+            self.add_variable(start, f"repetitions of the loop at line {record[2]} (instructions {start}-{end})")
+
+    def add_variable(self, start, description):
+        variable = f"n{len(self.variables) + 1}"
+        self.variables[start] = variable
+        self.descriptions[variable] = description
+
+    # The larger of the costs of two paths (the estimate is no longer exact if it depends on the path)
+    def larger(self, first, second):
+        if first is None:
+            return second
+        if not first.same_constant(second):
+            self.exact = False
+        return first.maximum(second)
+
+    def join(self, costs, address, cost):
+        costs[address] = self.larger(costs.get(address), cost)
+
+    """
+    Returns the costs of the code from 'start' to 'end' (a loop if 'is_loop'): the costs of the paths that jump back
+    (by the address they jump to, the start unless the loop was joined from two overlapping ones) and the costs of
+    the paths leaving the code (by the address they go to, None for HALT).
+    """
+    def region(self, start, end, is_loop):
+        costs = {start: Cost()}
+        backs = {}
+        exits = {}
+
+        def follow(source, target, cost):
+            if is_loop and target is not None and start <= target <= source:
+                self.join(backs, target, cost)
+            elif target is None or not start <= target <= end:
+                self.join(exits, target, cost)
+            elif target > source:
+                self.join(costs, target, cost)
+            else:
+                raise EstimateError(f"Jump from {source} back to {target} is not a loop")
+
+        p = start
+        while p <= end:
+            if p not in costs:
+                p += 1
+                continue
+            cost = costs[p]
+            if p in self.loops and (p != start or not is_loop):
+                loop_end = self.loops[p]
+                for target, loop_cost in self.loop(p, loop_end).items():
+                    follow(loop_end, target, cost + loop_cost)
+                p = loop_end + 1
+                continue
+            name, operand = self.program[p]
+            cost = cost + Cost.constant(COSTS.get(name, 1))
+            if name == "HALT":
+                follow(p, None, cost)
+            elif name == "JUMP":
+                follow(p, operand, cost)
+            else:
+                if name in ("JPOS", "JZERO"):
+                    follow(p, operand, cost)
+                follow(p, p + 1 if p + 1 < len(self.program) else None, cost)
+            p += 1
+        return backs, exits
+
+    # Costs of the whole loop by the addresses it leaves to
+    def loop(self, start, end):
+        backs, exits = self.region(start, end, True)
+        # A path that jumps back to the middle of the loop is only a part of a path from the start
+        iteration = None
+        for cost in backs.values():
+            iteration = self.larger(iteration, cost)
+        variable = self.variables.get(start)
+        result = {}
+        for target, cost in exits.items():
+            if variable is not None:
+                # The loops of the source check their condition at the end, so the last iteration leaves from there
+                result[target] = self.larger(iteration, cost).times(variable)
+            else:
+                # Every backward jump is taken at most once per bit
+                self.exact = False
+                result[target] = iteration.scaled(WORD_BITS * len(backs)) + cost
+        return result
+
+    # Cost of the whole program (of its most expensive way to HALT)
+    def estimate(self):
+        _, exits = self.region(0, len(self.program) - 1, False)
+        if not exits:
+            raise EstimateError("The program never ends")
+        total = None
+        for cost in exits.values():
+            total = self.larger(total, cost)
+        return total
+
+    def report(self):
+        cost = self.estimate()
+        lines = [f"Estimated cost ({'exact' if self.exact else 'worst case'}): {cost}"]
+        for variable, description in self.descriptions.items():
+            if any(variable in product for product in cost.terms):
+                lines.append(f"  {variable} - {description}")
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Estimates the cost of a compiled program without running it.")
+    parser.add_argument("program_file", help="compiled program (text or binary)")
+    parser.add_argument("--table", help="debug table of the program (main.py --debug-table), names the loops of the source")
+    args = parser.parse_args()
+
+    print(CostEstimator(load_program(args.program_file), DebugTable.read(args.table) if args.table else None).report())
@@ -1,8 +1,15 @@
+import bisect
+
+# Version of the compiler (part of the compile cache key)
+COMPILER_VERSION = "1.1"
+
 # All variables and arrays are initialized from top to bottom
 # and the rest of the memory is for creating constants
 
 global_consts_address = 0  # First free memory cell address
 program_lines = []  # List of all program lines
+program_lines_index = {}  # Lines starting with every token type (in order)
+program_lines_positions = {}  # Position of every line in 'program_lines'
 global_command_lineno = 0  # Current line of code
 
 
@@ -15,6 +22,22 @@ def modify_global_consts_address(address):
     global_consts_address = address
 
 
+# Indexing the program lines (after all of them have been added), so the next line of a command is found quickly
+def index_program_lines():
+    program_lines_index.clear()
+    program_lines_positions.clear()
+    for position, (token_type, lineno) in enumerate(program_lines):
+        program_lines_index.setdefault(token_type, []).append(lineno)
+        program_lines_positions[lineno] = position
+
+
+# Returns the first line after the given one that starts with the token type (None if there is none)
+def next_program_line(token_type, lineno):
+    lines = program_lines_index.get(token_type, [])
+    i = bisect.bisect_right(lines, lineno)
+    return lines[i] if i < len(lines) else None
+
+
 def get_global_command_lineno():
     return global_command_lineno
 
@@ -22,3 +45,39 @@ def get_global_command_lineno():
 def modify_global_command_lineno(value):
     global global_command_lineno
     global_command_lineno = value
+
+
+procedure_cache = None  # Cache of the procedures' generated code (None if disabled)
+
+
+def get_procedure_cache():
+    return procedure_cache
+
+
+def modify_procedure_cache(cache):
+    global procedure_cache
+    procedure_cache = cache
+
+
+debug_table = None  # Lines of the generated instructions (None if not requested)
+
+
+def get_debug_table():
+    return debug_table
+
+
+def modify_debug_table(table):
+    global debug_table
+    debug_table = table
+
+
+compiler_stats = None  # Statistics of the compilation (None if not requested)
+
+
+def get_compiler_stats():
+    return compiler_stats
+
+
+def modify_compiler_stats(stats):
+    global compiler_stats
+    compiler_stats = stats
@@ -0,0 +1,248 @@
+from symbols import Variable, Array
+from procedure_symbols import ProcedureVariable, ProcedureArray
+
+from globals import modify_global_consts_address
+from constants import create_const_cost
+from unroll import unrolled_blocks
+
+# Every access inside a loop is counted as this many accesses (per level of nesting)
+LOOP_WEIGHT = 10
+
+
+# Class responsible for counting how many times every symbol of the encoder is used
+class AccessCounter:
+    """
+    AccessCounter's attributes are:
+    - weights: number of accesses to every symbol (by name), accesses inside loops weigh more
+    - calls: procedure calls inside the code as tuples (procedure's name, arguments, weight of the call)
+    """
+    def __init__(self, commands):
+        self.weights = {}
+        self.calls = []
+        self.count_commands(commands, 1)
+
+    def add(self, name, weight):
+        self.weights[name] = self.weights.get(name, 0) + weight
+
+    def count_commands(self, commands, weight):
+        for command in commands:
+            if command[0] == "assign":
+                self.count_identifier(command[1], weight)
+                self.count_expression(command[2], weight)
+            elif command[0] == "if":
+                self.count_expression(command[1], weight)
+                self.count_commands(command[2], weight)
+            elif command[0] == "ifelse":
+                self.count_expression(command[1], weight)
+                self.count_commands(command[2], weight)
+                self.count_commands(command[3], weight)
+            elif command[0] in ("while", "until"):
+                # The condition is checked in every iteration as well
+                self.count_expression(command[1], weight * LOOP_WEIGHT)
+                self.count_commands(command[2], weight * LOOP_WEIGHT)
+            elif command[0] == "unrolled":
+                for condition, block, repeated in unrolled_blocks(command):
+                    block_weight = weight * LOOP_WEIGHT if repeated else weight
+                    if condition is not None:
+                        self.count_expression(condition, block_weight)
+                    self.count_commands(block, block_weight)
+            elif command[0] == "folded":
+                # Only the memory cells are set (the original commands are done by the compiler)
+                for identifier, _ in command[3]:
+                    self.count_identifier(identifier, weight)
+            elif command[0] == "proc_call":
+                self.calls.append((command[1][0], command[1][1], weight))
+            elif command[0] == "read":
+                self.count_identifier(command[1], weight)
+            elif command[0] == "write":
+                self.count_expression(command[1], weight)
+
+    # Counting the values of an expression or a condition
+    def count_expression(self, expression, weight):
+        if expression[0] == "load":
+            self.count_identifier(expression[1], weight)
+        elif expression[0] != "const":
+            self.count_expression(expression[1], weight)
+            self.count_expression(expression[2], weight)
+
+    def count_identifier(self, identifier, weight):
+        if type(identifier) == str:
+            self.add(identifier, weight)
+        elif identifier[0] == "array":
+            self.add(identifier[1], weight)
+            if type(identifier[2]) == tuple:
+                self.count_expression(identifier[2], weight)
+
+
+# Returns the names of the symbols whose values may be used before they are set inside the commands
+# (their values have to be kept between the calls of the procedure)
+def exposed_symbols(commands):
+    exposed = set()
+    find_exposed_symbols(commands, set(), exposed)
+    return exposed
+
+
+# Returns the set of symbols that are always set after the commands
+def find_exposed_symbols(commands, assigned, exposed):
+    def use_identifier(identifier):
+        if type(identifier) == str:
+            if identifier not in assigned:
+                exposed.add(identifier)
+        elif identifier[0] == "array":
+            # Arrays are never known to be set as a whole
+            exposed.add(identifier[1])
+            if type(identifier[2]) == tuple:
+                use_expression(identifier[2])
+
+    def use_expression(expression):
+        if expression[0] == "load":
+            use_identifier(expression[1])
+        elif expression[0] != "const":
+            use_expression(expression[1])
+            use_expression(expression[2])
+
+    def set_identifier(identifier):
+        if type(identifier) == str:
+            assigned.add(identifier)
+        elif identifier[0] == "array" and type(identifier[2]) == tuple:
+            use_expression(identifier[2])
+
+    for command in commands:
+        if command[0] == "assign":
+            use_expression(command[2])
+            set_identifier(command[1])
+        elif command[0] == "read":
+            set_identifier(command[1])
+        elif command[0] == "write":
+            use_expression(command[1])
+        elif command[0] == "if":
+            use_expression(command[1])
+            find_exposed_symbols(command[2], set(assigned), exposed)
+        elif command[0] == "ifelse":
+            use_expression(command[1])
+            assigned_if = find_exposed_symbols(command[2], set(assigned), exposed)
+            assigned_else = find_exposed_symbols(command[3], set(assigned), exposed)
+            assigned = assigned_if & assigned_else
+        elif command[0] == "while":
+            # The loop may not be executed at all
+            use_expression(command[1])
+            find_exposed_symbols(command[2], set(assigned), exposed)
+        elif command[0] == "until":
+            assigned = find_exposed_symbols(command[2], assigned, exposed)
+            use_expression(command[1])
+        elif command[0] == "unrolled":
+            # The copies inside a loop may not be done at all, the other ones are always done
+            for condition, block, repeated in unrolled_blocks(command):
+                if condition is not None:
+                    use_expression(condition)
+                if repeated:
+                    find_exposed_symbols(block, set(assigned), exposed)
+                else:
+                    assigned = find_exposed_symbols(block, assigned, exposed)
+        elif command[0] == "proc_call":
+            # The procedure may use the arguments' values
+            for arg in command[1][1]:
+                exposed.add(arg)
+    return assigned
+
+
+"""
+Function responsible for placing the variables in the memory, so the most used ones get the addresses that are
+the cheapest to create (each LOAD and STORE has to create the address first). The variables are placed first,
+then the arrays (the most used ones first as well) and the rest of the memory is left for the constants.
+The weights can be given from the outside (e.g. from a profile) as a dictionary (procedure's name, symbol's name) -> weight,
+the main program's name is an empty string. The symbols missing from it keep their counted weights.
+
+The procedures are inlined, so the locals of two procedures that are never on the same chain of calls are never
+used at the same time and they can share the memory (like frames on a stack). Only the locals that are always set
+before they are used are shared, the other ones keep their values between the calls, so they get their own cells.
+"""
+def assign_memory_layout(encoders, weights=None):
+    counters = [AccessCounter(encoder.commands) for encoder in encoders]
+
+    # Accesses to the arguments of every procedure (per call), including the accesses inside the procedures it calls
+    # (the procedures can only call the ones defined earlier, so they are already counted)
+    argument_weights = {}
+    for encoder, counter in zip(encoders, counters):
+        for procedure, args, weight in counter.calls:
+            for i, arg in enumerate(args):
+                if procedure in argument_weights and i < len(argument_weights[procedure]):
+                    counter.add(arg, weight * argument_weights[procedure][i])
+        if encoder.is_procedure:
+            argument_weights[encoder.symbols.name] = [counter.weights.get(arg, 0) for arg in encoder.symbols.args]
+
+    # How many times the code of every procedure is executed (the main program is executed once)
+    frequency = [0] * len(encoders)
+    frequency[-1] = 1
+    positions = {encoder.symbols.name: i for i, encoder in enumerate(encoders) if encoder.is_procedure}
+    for i in range(len(encoders) - 1, -1, -1):
+        for procedure, _, weight in counters[i].calls:
+            if procedure in positions:
+                frequency[positions[procedure]] += frequency[i] * weight
+
+    # Procedures called by every procedure (directly or not)
+    reachable = []
+    for counter in counters:
+        called = set()
+        for procedure, _, _ in counter.calls:
+            if procedure in positions:
+                called.add(positions[procedure])
+                called |= reachable[positions[procedure]]
+        reachable.append(called)
+
+    # Two procedures' frames are used at the same time if one of them calls the other one
+    def live_together(first, second):
+        return first == second or first in reachable[second] or second in reachable[first]
+
+    scalars = []
+    arrays = []
+    for i, (encoder, counter) in enumerate(zip(encoders, counters)):
+        name = encoder.symbols.name if encoder.is_procedure else ""
+        # Symbols that get their own cells: the locals read before they are set and all the main program's variables
+        # (they are used during the whole program)
+        unshareable = exposed_symbols(encoder.commands) if encoder.is_procedure else set(encoder.symbols)
+        for symbol_name, symbol in encoder.symbols.items():
+            weight = weights.get((name, symbol_name)) if weights is not None else None
+            if weight is None:
+                weight = frequency[i] * counter.weights.get(symbol_name, 0)
+            entry = (-weight, len(scalars) + len(arrays), symbol, i, symbol_name in unshareable)
+            if type(symbol) == Variable or type(symbol) == ProcedureVariable:
+                scalars.append(entry)
+            elif type(symbol) == Array or type(symbol) == ProcedureArray:
+                arrays.append(entry)
+
+    def conflict(first, second):
+        return first[4] or second[4] or live_together(first[3], second[3])
+
+    # The most used variables get the cheapest addresses that are not used by a variable live at the same time
+    scalars.sort(key=lambda s: s[:2])
+    limit = 4 * len(scalars) + 16
+    addresses = sorted(range(limit), key=lambda address: (create_const_cost(address), address))
+    occupants = {}
+    first_free = 0
+    for entry in scalars:
+        for address in addresses:
+            if not any(conflict(entry, other) for other in occupants.get(address, [])):
+                break
+        occupants.setdefault(address, []).append(entry)
+        entry[2].memory_offset = address
+        first_free = max(first_free, address + 1)
+
+    # The arrays are placed right after the variables (at the first range not used by an array live at the same time)
+    arrays.sort(key=lambda a: a[:2])
+    placed = []
+    arrays_end = first_free
+    for entry in arrays:
+        start = first_free
+        moved = True
+        while moved:
+            moved = False
+            for other, other_start in placed:
+                if conflict(entry, other) and start < other_start + other[2].size and other_start < start + entry[2].size:
+                    start = other_start + other[2].size
+                    moved = True
+        placed.append((entry, start))
+        entry[2].memory_offset = start
+        arrays_end = max(arrays_end, start + entry[2].size)
+
+    modify_global_consts_address(arrays_end)
@@ -2,13 +2,25 @@ from symbols import ProgramSymbols, Array, Variable
 from procedure_symbols import (ProcedureSymbols, ProcedureArray, ProcedureArgsArray,
                                ProcedureVariable, ProcedureArgsVariable)
 from encoder import Encoder
+from layout import assign_memory_layout
+from unroll import unroll_loops
+from ranges import analyze_ranges
+from partial_eval import fold_program
+from call_graph import remove_uncalled_procedures
+from writer import TextCodeWriter, BinaryCodeWriter
+from stats import CompilerStats, measure
+from cache import CompileCache, ProcedureCache, Tee, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from parse_tables import build_parser
+from scanner import scan
 
 from sly import Lexer
 from sly import Parser
 import sys
 import ast
+import argparse
+import contextlib
 
-from globals import modify_global_consts_address, program_lines, modify_global_command_lineno
+from globals import modify_global_consts_address, get_global_consts_address, program_lines, index_program_lines, modify_global_command_lineno, modify_procedure_cache, modify_compiler_stats, modify_debug_table, get_debug_table
 
 
 # Lexer class for tokenizing the input
@@ -70,6 +82,10 @@ class ImperativeLexer(Lexer):
         t.value = int(t.value)
         return t
 
+    # The tokens are found by the fast scanner, which gives the same tokens as the rules above
+    def tokenize(self, text, lineno=1, index=0):
+        return scan(self, text, lineno, index)
+
     # Throw error
     def error(self, t):
         raise Exception(f"ERROR: Invalid symbol encountered - '{t.value[0]}' (line {self.lineno}")
@@ -84,13 +100,22 @@ class ImperativeParser(Parser):
     symbols = ProgramSymbols()
     # List of all encountered procedure variables/arrays
     all_procedures_symbols = []
-    consts = set()
     # List of all encoders (each for every procedure/main)
     whole_code = []
+    # Procedures' symbols and encoders by their names
+    procedures_by_name = {}
+    procedure_encoders = {}
+    # Names of the procedures called directly by the procedure (or main) that is being parsed
+    calls = []
     code = None
     # List of arguments for a procedure call
     arguments_to_call = []
 
+    # The LALR tables are taken from the disk when the grammar did not change
+    @classmethod
+    def _build(cls, definitions):
+        build_parser(cls, definitions)
+
     @_('procedures main')
     def program_all(self, p):
         return self.whole_code
@@ -109,8 +134,12 @@ class ImperativeParser(Parser):
         else:
             self.procedure_symbols.start_address = 1
 
-        self.code = Encoder(p.commands, self.procedure_symbols, self.whole_code, True, p.lineno)
+        self.code = Encoder(p.commands, self.procedure_symbols, self.whole_code, self.procedure_encoders, self.calls,
+                            True, p.lineno)
         self.whole_code.append(self.code)
+        self.procedures_by_name[self.procedure_symbols.name] = self.procedure_symbols
+        self.procedure_encoders[self.procedure_symbols.name] = self.code
+        self.calls = []
 
         self.procedure_symbols.end_address = len(self.whole_code)
         self.all_procedures_symbols.append(self.procedure_symbols)
@@ -123,7 +152,9 @@ class ImperativeParser(Parser):
     @_('PROGRAM IS declarations IN commands END', 'PROGRAM IS IN commands END')
     def main(self, p):
         modify_global_command_lineno(p.lineno)
-        self.code = Encoder(p.commands, self.symbols, self.whole_code, False, p.lineno)
+        self.code = Encoder(p.commands, self.symbols, self.whole_code, self.procedure_encoders, self.calls, False,
+                            p.lineno)
+        self.calls = []
         if self.all_procedures_symbols:
             modify_global_consts_address(self.symbols.memory_offset + self.all_procedures_symbols[-1].memory_offset)
         else:
@@ -134,7 +165,9 @@ class ImperativeParser(Parser):
 
     @_('commands command')
     def commands(self, p):
-        return p[0] + [p[1]]
+        # Appending in place (copying the list every time would be quadratic in the number of commands)
+        p[0].append(p[1])
+        return p[0]
 
     @_('command')
     def commands(self, p):
@@ -146,21 +179,15 @@ class ImperativeParser(Parser):
 
     @_('IF condition THEN commands ELSE commands ENDIF')
     def command(self, p):
-        resp = "ifelse", p[1], p[3], p[5], self.consts.copy()
-        self.consts.clear()
-        return resp
+        return "ifelse", p[1], p[3], p[5]
 
     @_('IF condition THEN commands ENDIF')
     def command(self, p):
-        resp = "if", p[1], p[3], self.consts.copy()
-        self.consts.clear()
-        return resp
+        return "if", p[1], p[3]
 
     @_('WHILE condition DO commands ENDWHILE')
     def command(self, p):
-        resp = "while", p[1], p[3], self.consts.copy()
-        self.consts.clear()
-        return resp
+        return "while", p[1], p[3]
 
     @_('REPEAT commands UNTIL condition ";"')
     def command(self, p):
@@ -176,8 +203,6 @@ class ImperativeParser(Parser):
 
     @_('WRITE value ";"')
     def command(self, p):
-        if p[1][0] == "const":
-            self.consts.add(int(p[1][1]))
         return "write", p[1]
 
     @_('PID "(" args_decl ")"')
@@ -191,14 +216,17 @@ class ImperativeParser(Parser):
             raise Exception(f"No procedure named '{p[0]}' found or a procedure used recursively (line {p.lineno})!")
         else:
             # Checking if a procedure with the given identifier exists
-            for procedure in self.all_procedures_symbols:
-                if p[0] == procedure.name:
-                    # Procedure was found but the number of arguments does not match
-                    if len(p[2]) != len(procedure.args):
-                        raise Exception(f"Wrong number of arguments for procedure '{p[0]}' (line {p.lineno})!")
-                    # Clearing received arguments list
-                    self.arguments_to_call = []
-                    return p[0], p[2]
+            procedure = self.procedures_by_name.get(p[0])
+            if procedure is not None:
+                # Procedure was found but the number of arguments does not match
+                if len(p[2]) != len(procedure.args):
+                    raise Exception(f"Wrong number of arguments for procedure '{p[0]}' (line {p.lineno})!")
+                # Clearing received arguments list
+                self.arguments_to_call = []
+                # Adding the edge of the call graph
+                if p[0] not in self.calls:
+                    self.calls.append(p[0])
+                return p[0], p[2]
 
             raise Exception(f"No procedure named '{p[0]}' found or a procedure used recursively! (line {p.lineno})!")
 
@@ -371,26 +399,167 @@ class ImperativeParser(Parser):
             raise Exception(f"Undeclared array {p[0]} (line {p.lineno})!")
 
 
-if __name__ == '__main__':
-    with open(sys.argv[1]) as in_f:
-        text = in_f.read()
-
-    lexer = ImperativeLexer()
-    current_line = None
-    for tok in lexer.tokenize(text):
-        if current_line != tok.lineno:
-            current_line = tok.lineno
-            program_lines.append((tok.type, tok.lineno))  # Append a tuple with token type and line number
-
-
-    parser = ImperativeParser()
-
-    parser.parse(lexer.tokenize(text))
+def compile_program(text, writer=None, profile=None):
+    with measure("lex"):
+        lexer = ImperativeLexer()
+        tokens = list(lexer.tokenize(text))
+        current_line = None
+        for tok in tokens:
+            if current_line != tok.lineno:
+                current_line = tok.lineno
+                program_lines.append((tok.type, tok.lineno))  # Append a tuple with token type and line number
+        index_program_lines()
+
+    with measure("parse"):
+        parser = ImperativeParser()
+
+        parser.parse(iter(tokens))
+        # The lines of the loops are found while all the procedures are still there
+        loops = []
+        if profile is not None:
+            from pgo import loop_lines
+            loops = loop_lines(parser.whole_code, tokens)
+        # The procedures that are never called do not need the memory
+        remove_uncalled_procedures(parser.whole_code)
+
+    # Running the beginning of the program that does not depend on the input at the compile time
+    with measure("fold"):
+        fold_program(parser.whole_code)
+
+    # Unrolling the counted loops (before the layout, so the new code is counted as well),
+    # except the ones that did not repeat when the program was profiled
+    with measure("unroll"):
+        unroll_loops(parser.whole_code, profile.cold_loops(loops) if profile is not None else frozenset())
+
+    # Finding the ranges of the values, so the multiplications and divisions leave out the checks that cannot fail
+    with measure("ranges"):
+        analyze_ranges(parser.whole_code)
+
+    # Placing the most used variables at the cheapest addresses (the profile tells how much they were used)
+    with measure("layout"):
+        assign_memory_layout(parser.whole_code, profile.symbol_weights(parser.whole_code, tokens) if profile is not None else None)
 
     # Receiving the last encoder (it is the main program)
     code_gen = parser.whole_code[-1]
+    # The finished code goes straight to the writer instead of being kept in the memory
+    code_gen.writer = writer
+
+    with measure("encode"):
+        code_gen.create_assembly_code()
+    return code_gen.code
+
+
+def write_program(text, args, profile=None):
+    # Capturing the warnings, so they can be shown again when the program is taken from the cache
+    output = Tee(sys.stdout)
+    if args.format == "binary":
+        with contextlib.redirect_stdout(output), open(args.output_file, 'wb') as out_f:
+            writer = BinaryCodeWriter(out_f)
+            compile_program(text, writer, profile)
+            with measure("write"):
+                writer.close(get_global_consts_address())
+    else:
+        with contextlib.redirect_stdout(output), open(args.output_file, 'w') as out_f:
+            writer = TextCodeWriter(out_f)
+            compile_program(text, writer, profile)
+            with measure("write"):
+                writer.close()
+    return writer.count, output.getvalue()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Compiler of the imperative language")
+    arg_parser.add_argument("input_file")
+    arg_parser.add_argument("output_file")
+    arg_parser.add_argument("--format", choices=["text", "binary"], default="text",
+                            help="format of the output file (the binary one is loaded by the virtual machine without parsing)")
+    arg_parser.add_argument("--no-cache", action="store_true", help="do not use the compile cache")
+    arg_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="folder of the compile cache")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                            help="maximal size of the compile cache (in bytes)")
+    arg_parser.add_argument("--stats", action="store_true",
+                            help="show time and peak memory of every phase of the compilation")
+    arg_parser.add_argument("--stats-json", metavar="FILE",
+                            help="write the statistics of the compilation as JSON to the file ('-' for the standard output)")
+    arg_parser.add_argument("--debug-table", metavar="FILE",
+                            help="write the lines of the generated instructions to the file (used with the profile of the "
+                                 "virtual machine, the compile cache is not used)")
+    arg_parser.add_argument("--profile-use", nargs=2, metavar=("PROFILE", "TABLE"),
+                            help="use the profile written by the virtual machine (--profile) and the debug table of the "
+                                 "profiled program to choose the loops to unroll and the memory layout")
+    arg_parser.add_argument("--estimate-cost", action="store_true",
+                            help="show the cost of the compiled program without running it (as a formula of the loops' "
+                                 "iteration counts, the compile cache is not used)")
+    args = arg_parser.parse_args()
+
+    stats = None
+    if args.stats or args.stats_json:
+        stats = CompilerStats()
+        modify_compiler_stats(stats)
+
+    with open(args.input_file) as in_f:
+        text = in_f.read()
 
-    code_gen.create_assembly_code()
-    with open(sys.argv[2], 'w') as out_f:
-        for line in code_gen.code:
-            print(line, file=out_f)
\ No newline at end of file
+    # The modules used only by some of the flags are imported when they are needed (shorter startup)
+    profile = None
+    if args.profile_use:
+        from pgo import Profile
+        profile = Profile(*args.profile_use)
+
+    # Flags that change the generated code
+    flags = (("format", args.format),)
+    if profile is not None:
+        flags += (("profile", profile.digest),)
+
+    cache = None
+    entry = None
+    # The debug table is filled in while the code is generated, so nothing can be taken from the cache
+    if args.debug_table or args.estimate_cost:
+        from pgo import DebugTable
+        modify_debug_table(DebugTable())
+    elif not args.no_cache:
+        cache = CompileCache(args.cache_dir, args.cache_size)
+        with measure("cache"):
+            cache_key = cache.key(text, flags)
+            entry = cache.get(cache_key)
+
+    # The program has already been compiled, so lexing, parsing and encoding are skipped
+    if entry is not None:
+        code, diagnostics, instructions = entry
+        print(diagnostics, end="")
+        if stats is not None:
+            stats.cache_hit = True
+            # The procedures are not inlined again, so only the number of the instructions is known
+            stats.instructions = instructions
+            stats.inline_expansions = None
+        with measure("write"), open(args.output_file, 'wb') as out_f:
+            out_f.write(code)
+    else:
+        # Procedures that did not change are not encoded again (an inlined procedure called again with the same
+        # arguments is copied even without the compile cache)
+        modify_procedure_cache(ProcedureCache(cache))
+
+        instructions, diagnostics = write_program(text, args, profile)
+        if stats is not None:
+            stats.instructions = instructions
+        if args.debug_table:
+            get_debug_table().write(args.debug_table)
+        # The loops of the source are found in the debug table
+        if args.estimate_cost:
+            with measure("estimate"):
+                from estimate import CostEstimator
+                from simulator import load_program
+                print(CostEstimator(load_program(args.output_file), get_debug_table()).report())
+
+        if cache is not None:
+            with measure("cache"), open(args.output_file, 'rb') as out_f:
+                cache.put(cache_key, out_f.read(), diagnostics, instructions)
+
+    if stats is not None:
+        if args.stats:
+            print(stats.report())
+        if args.stats_json == "-":
+            print(stats.to_json())
+        elif args.stats_json:
+            with open(args.stats_json, 'w') as stats_f:
+                print(stats.to_json(), file=stats_f)
@@ -0,0 +1,93 @@
+/*
+ * Wczytywanie kodu w postaci binarnej (zamiast parsowania tekstu)
+ *
+ * Format:
+ *   "MWB1"                    - 4 bajty
+ *   liczba rozkazów           - 8 bajtów (little endian)
+ *   rozmiar pamięci           - 8 bajtów (little endian, tylko podpowiedź)
+ *   rozkazy                   - bajt z kodem rozkazu + argument jako varint (LEB128)
+*/
+#include <iostream>
+
+#include <utility>
+#include <vector>
+#include <cstring>
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include "instructions.hh"
+#include "colors.hh"
+
+using namespace std;
+
+static const char binary_magic[4] = { 'M', 'W', 'B', '1' };
+static const size_t header_size = 4 + 8 + 8;
+
+bool is_binary_program( FILE * data )
+{
+  char magic[4];
+  bool binary = fread( magic, 1, 4, data )==4 && memcmp( magic, binary_magic, 4 )==0;
+  rewind( data );
+  return binary;
+}
+
+static void binary_error( char const * s )
+{
+  cerr << cRed << "Błąd: " << s << cReset << endl;
+  exit(-1);
+}
+
+static unsigned long long read_u64( unsigned char const * p )
+{
+  unsigned long long value = 0;
+  for( int i = 7; i>=0; i-- ) value = (value << 8) | p[i];
+  return value;
+}
+
+void run_binary_loader( vector< pair<int,int> > & program, char const * path )
+{
+  cout << cBlue << "Czytanie kodu (binarnego)." << cReset << endl;
+
+  int fd = open( path, O_RDONLY );
+  if( fd<0 ) binary_error( "Nie można otworzyć pliku z kodem." );
+
+  struct stat st;
+  if( fstat( fd, &st )<0 || (size_t)st.st_size<header_size ) binary_error( "Niepoprawny nagłówek kodu binarnego." );
+  size_t size = st.st_size;
+
+  void * mapped = mmap( NULL, size, PROT_READ, MAP_PRIVATE, fd, 0 );
+  if( mapped==MAP_FAILED ) binary_error( "Nie można odwzorować pliku z kodem." );
+  close( fd );
+
+  unsigned char const * data = (unsigned char const *) mapped;
+  unsigned char const * end = data + size;
+  unsigned long long count = read_u64( data + 4 );
+  unsigned long long memory = read_u64( data + 12 );
+
+  program.reserve( count );
+  unsigned char const * p = data + header_size;
+  for( unsigned long long i = 0; i<count; i++ )
+  {
+    if( p>=end ) binary_error( "Kod binarny jest niekompletny." );
+    int opcode = *p++;
+    if( opcode>HALT ) binary_error( "Nierozpoznany rozkaz w kodzie binarnym." );
+
+    unsigned long long operand = 0;
+    int shift = 0;
+    while( true )
+    {
+      if( p>=end || shift>63 ) binary_error( "Kod binarny jest niekompletny." );
+      unsigned char byte = *p++;
+      operand |= (unsigned long long)(byte & 0x7f) << shift;
+      if( !(byte & 0x80) ) break;
+      shift += 7;
+    }
+    program.push_back( make_pair( opcode, (int)operand ) );
+  }
+
+  munmap( mapped, size );
+  cout << cBlue << "Skończono czytanie kodu (liczba rozkazów: " << program.size() << "; pamięć: " << memory << ")." << cReset << endl;
+}
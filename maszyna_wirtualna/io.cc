@@ -0,0 +1,113 @@
+/*
+ * Wejście i wyjście maszyny wirtualnej
+ *
+ * W trybie wsadowym (--batch) liczby są czytane bez "? " z pliku (--input)
+ * albo ze standardowego wejścia, komunikaty maszyny nie są pokazywane,
+ * a wypisywane liczby są zbierane w buforze i wypisywane na końcu programu
+ * (albo po uzbieraniu dużej ich ilości). W trybie --json na końcu jest
+ * wypisywany obiekt {"output": [...], "cost": ..., "io": ...}.
+*/
+#include <cstdio>
+#include <cstdlib>
+#include <fstream>
+#include <iostream>
+#include <locale>
+#include <string>
+
+#include "io.hh"
+#include "colors.hh"
+
+using namespace std;
+
+static bool batch = false;
+static bool json = false;
+static bool first_output = true;
+static ifstream input_file;
+static string output;
+
+// Rozmiar bufora, po którym jest on wypisywany przed końcem programu
+static const size_t output_buffer_size = 1 << 20;
+
+static void flush_output()
+{
+  fwrite( output.data(), 1, output.size(), stdout );
+  output.clear();
+}
+
+void set_batch_io( bool as_json, char const * input_path )
+{
+  batch = true;
+  json = as_json;
+  if( input_path )
+  {
+    input_file.open( input_path );
+    if( !input_file )
+    {
+      cerr << cRed << "Błąd: Nie można otworzyć pliku " << input_path << cReset << endl;
+      exit(-1);
+    }
+  }
+  // Komunikaty o czytaniu kodu i uruchamianiu programu nie są wypisywane
+  cout.setstate( ios::failbit );
+  if( json ) output = "{\"output\": [";
+}
+
+istream & machine_input()
+{
+  return input_file.is_open() ? input_file : cin;
+}
+
+void machine_prompt()
+{
+  if( !batch ) cout << "? ";
+}
+
+void machine_write( string const & value )
+{
+  if( !batch )
+  {
+    cout << "> " << value << endl;
+    return;
+  }
+  if( json )
+  {
+    if( !first_output ) output += ", ";
+    output += value;
+  }
+  else
+  {
+    output += "> ";
+    output += value;
+    output += '\n';
+  }
+  first_output = false;
+  if( output.size()>=output_buffer_size ) flush_output();
+}
+
+void machine_finish( long long t, long long io )
+{
+  if( !batch )
+  {
+    cout.imbue(std::locale(""));
+    cout << cBlue << "Skończono program (koszt: " << cRed << (t+io) << cBlue << "; w tym i/o: " << io << ")." << cReset << endl;
+    return;
+  }
+  if( json )
+    output += "], \"cost\": " + to_string( t+io ) + ", \"io\": " + to_string( io ) + "}\n";
+  else
+    output += "koszt: " + to_string( t+io ) + "; w tym i/o: " + to_string( io ) + "\n";
+  flush_output();
+  fflush( stdout );
+}
+
+void machine_error( string const & message )
+{
+  if( batch )
+  {
+    if( json ) output += "], \"error\": \"" + message + "\"}\n";
+    flush_output();
+    fflush( stdout );
+  }
+  cerr << cRed << "Błąd: " << message << cReset << endl;
+  exit(-1);
+}
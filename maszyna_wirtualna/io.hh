@@ -0,0 +1,14 @@
+/*
+ * Wejście i wyjście maszyny wirtualnej (zwykłe albo wsadowe)
+*/
+#pragma once
+
+#include <istream>
+#include <string>
+
+void set_batch_io( bool json, char const * input_path );
+std::istream & machine_input();
+void machine_prompt();
+void machine_write( std::string const & value );
+void machine_finish( long long t, long long io );
+void machine_error( std::string const & message );
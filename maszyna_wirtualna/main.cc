@@ -6,38 +6,76 @@
  * 2023-11-15
 */
 #include <iostream>
+#include <cstring>
 
 #include <utility>
 #include <vector>
 
 #include "colors.hh"
+#include "io.hh"
+#include "profile.hh"
 
 using namespace std;
 
 extern void run_parser( vector< pair<int,int> > & program, FILE * data );
+extern bool is_binary_program( FILE * data );
+extern void run_binary_loader( vector< pair<int,int> > & program, char const * path );
 extern void run_machine( vector< pair<int,int> > & program );
 
 int main( int argc, char const * argv[] )
 {
   vector< pair<int,int> > program;
   FILE * data;
+  char const * path = NULL;
+  char const * input_path = NULL;
+  char const * profile_path = NULL;
+  bool batch = false, json = false;
 
-  if( argc!=2 )
+  for( int i = 1; i<argc; i++ )
   {
-    cerr << cRed << "Sposób użycia programu: interpreter kod" << cReset << endl;
+    if( strcmp( argv[i], "--batch" )==0 ) batch = true;
+    else if( strcmp( argv[i], "--json" )==0 ) batch = json = true;
+    else if( strcmp( argv[i], "--input" )==0 && i+1<argc )
+    {
+      batch = true;
+      input_path = argv[++i];
+    }
+    else if( strcmp( argv[i], "--profile" )==0 && i+1<argc ) profile_path = argv[++i];
+    else if( !path ) path = argv[i];
+    else
+    {
+      // Za dużo argumentów
+      path = NULL;
+      break;
+    }
+  }
+  if( !path )
+  {
+    cerr << cRed << "Sposób użycia programu: interpreter [--batch] [--json] [--input plik] [--profile plik] kod" << cReset << endl;
     return -1;
   }
 
-  data = fopen( argv[1], "r" );
+  data = fopen( path, "r" );
   if( !data )
   {
-    cerr << cRed << "Błąd: Nie można otworzyć pliku " << argv[1] << cReset << endl;
+    cerr << cRed << "Błąd: Nie można otworzyć pliku " << path << cReset << endl;
     return -1;
   }
 
-  run_parser( program, data );
+  if( batch ) set_batch_io( json, input_path );
+
+  if( is_binary_program( data ) )
+  {
+    fclose( data );
+    run_binary_loader( program, path );
+  }
+  else
+  {
+    run_parser( program, data );
+    fclose( data );
+  }
 
-  fclose( data );
+  if( profile_path ) set_profile( profile_path, program );
 
   run_machine( program );
 
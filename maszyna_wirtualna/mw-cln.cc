@@ -12,6 +12,7 @@
 #include <utility>
 #include <vector>
 #include <map>
+#include <sstream>
 
 #include <cstdlib> 	// rand()
 #include <ctime>
@@ -20,6 +21,8 @@
 
 #include "instructions.hh"
 #include "colors.hh"
+#include "io.hh"
+#include "profile.hh"
 
 using namespace std;
 using namespace cln;
@@ -41,10 +44,11 @@ void run_machine( vector< pair<int,int> > & program )
   io = 0;
   while( program[lr].first!=HALT )	// HALT
   {
+    int current = lr;
     switch( program[lr].first )
     {
-      case READ:	cout << "? "; cin >> r[0]; io+=100; lr++; break;
-      case WRITE:	cout << "> " << r[0] << endl; io+=100; lr++; break;
+      case READ:	machine_prompt(); machine_input() >> r[0]; io+=100; lr++; break;
+      case WRITE:	{ ostringstream s; s << r[0]; machine_write( s.str() ); } io+=100; lr++; break;
 
       case LOAD:	r[0] = pam[r[program[lr].second]]; t+=50; lr++; break;
       case STORE:	pam[r[program[lr].second]] = r[0]; t+=50; lr++; break;
@@ -68,13 +72,10 @@ void run_machine( vector< pair<int,int> > & program )
 
       default: break;
     }
+    if( profiling ) profile_step( current, lr );
     if( lr<0 || lr>=(int)program.size() )
-    {
-      cerr << cRed << "Błąd: Wywołanie nieistniejącej instrukcji nr " << lr << "." << cReset << endl;
-      exit(-1);
-    }
+      machine_error( "Wywołanie nieistniejącej instrukcji nr " + to_string( lr ) + "." );
   }
-  cout.imbue(std::locale(""));
-  cout << cBlue << "Skończono program (koszt: " << cRed << (t+io) << cBlue << "; w tym i/o: " << io << ")." << cReset << endl;
+  machine_finish( t, io );
 }
 
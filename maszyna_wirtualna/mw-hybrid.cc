@@ -0,0 +1,238 @@
+/*
+ * Kod interpretera maszyny rejestrowej do projektu z JFTT2023
+ * (wersja hybrydowa)
+ *
+ * Liczby są trzymane w słowach maszynowych (jak w mw.cc), a rejestr albo
+ * komórka pamięci staje się liczbą dowolnej wielkości (jak w mw-cln.cc)
+ * dopiero wtedy, gdy wynik ADD, INC lub SHL (albo wczytana liczba) nie
+ * mieści się w 64 bitach. Gdy liczba znów się mieści, wraca do słowa.
+*/
+#include <iostream>
+#include <locale>
+
+#include <climits>
+#include <string>
+#include <utility>
+#include <vector>
+#include <map>
+
+#include <cstdlib> 	// rand()
+#include <ctime>
+
+#include "instructions.hh"
+#include "colors.hh"
+#include "io.hh"
+#include "profile.hh"
+
+using namespace std;
+
+// Liczba nieujemna: słowo albo (gdy big nie jest puste) cyfry w systemie 2^32 od najmniej znaczącej
+struct Number
+{
+  unsigned long long word = 0;
+  vector<unsigned int> big;
+};
+
+static vector<unsigned int> digits( Number const & x )
+{
+  if( !x.big.empty() ) return x.big;
+  return { (unsigned int)x.word, (unsigned int)(x.word >> 32) };
+}
+
+// Usuwa zera z początku i zamienia liczbę na słowo, jeśli się w nim mieści
+static void normalize( Number & x, vector<unsigned int> & d )
+{
+  while( !d.empty() && d.back()==0 ) d.pop_back();
+  if( d.size()<=2 )
+  {
+    x.word = (d.size()>0 ? d[0] : 0) | (d.size()>1 ? (unsigned long long)d[1] << 32 : 0);
+    x.big.clear();
+  }
+  else
+    x.big.swap( d );
+}
+
+static bool is_zero( Number const & x ) { return x.big.empty() && x.word==0; }
+
+// Liczby w postaci big są zawsze większe od słów
+static int compare( Number const & x, Number const & y )
+{
+  if( x.big.empty() && y.big.empty() ) return x.word<y.word ? -1 : (x.word>y.word ? 1 : 0);
+  if( x.big.size()!=y.big.size() ) return x.big.size()<y.big.size() ? -1 : 1;
+  for( size_t i = x.big.size(); i-->0; )
+    if( x.big[i]!=y.big[i] ) return x.big[i]<y.big[i] ? -1 : 1;
+  return 0;
+}
+
+struct NumberLess
+{
+  bool operator()( Number const & x, Number const & y ) const { return compare( x, y )<0; }
+};
+
+static void add_big( Number & x, Number const & y )
+{
+  vector<unsigned int> a = digits( x ), b = digits( y );
+  if( a.size()<b.size() ) a.resize( b.size(), 0 );
+  unsigned long long carry = 0;
+  for( size_t i = 0; i<a.size(); i++ )
+  {
+    carry += (unsigned long long)a[i] + (i<b.size() ? b[i] : 0);
+    a[i] = (unsigned int)carry;
+    carry >>= 32;
+  }
+  if( carry ) a.push_back( (unsigned int)carry );
+  normalize( x, a );
+}
+
+// x - y (gdy x >= y)
+static void sub_big( Number & x, Number const & y )
+{
+  vector<unsigned int> a = digits( x ), b = digits( y );
+  long long borrow = 0;
+  for( size_t i = 0; i<a.size(); i++ )
+  {
+    long long diff = (long long)a[i] - (i<b.size() ? b[i] : 0) - borrow;
+    borrow = diff<0;
+    a[i] = (unsigned int)(diff + (borrow ? (1LL << 32) : 0));
+  }
+  normalize( x, a );
+}
+
+static void shift_left_big( Number & x )
+{
+  vector<unsigned int> a = digits( x );
+  unsigned int carry = 0;
+  for( size_t i = 0; i<a.size(); i++ )
+  {
+    unsigned int next = a[i] >> 31;
+    a[i] = (a[i] << 1) | carry;
+    carry = next;
+  }
+  if( carry ) a.push_back( carry );
+  normalize( x, a );
+}
+
+static void shift_right_big( Number & x )
+{
+  vector<unsigned int> a = x.big;
+  for( size_t i = 0; i<a.size(); i++ )
+    a[i] = (a[i] >> 1) | (i+1<a.size() ? a[i+1] << 31 : 0);
+  normalize( x, a );
+}
+
+static Number read_number()
+{
+  string s;
+  machine_input() >> s;
+  Number x;
+  for( char c : s )
+  {
+    if( c<'0' || c>'9' ) break;
+    // x = 10x + c
+    if( x.big.empty() && x.word<=(ULLONG_MAX - 9) / 10 )
+      x.word = x.word * 10 + (c - '0');
+    else
+    {
+      vector<unsigned int> a = digits( x );
+      unsigned long long carry = c - '0';
+      for( size_t i = 0; i<a.size(); i++ )
+      {
+        carry += (unsigned long long)a[i] * 10;
+        a[i] = (unsigned int)carry;
+        carry >>= 32;
+      }
+      if( carry ) a.push_back( (unsigned int)carry );
+      normalize( x, a );
+    }
+  }
+  return x;
+}
+
+static string number_string( Number const & x )
+{
+  if( x.big.empty() ) return to_string( x.word );
+  // Dzielenie przez 10^9, części są wypisywane od najbardziej znaczącej
+  vector<unsigned int> a = x.big;
+  vector<unsigned int> parts;
+  while( !a.empty() )
+  {
+    unsigned long long rest = 0;
+    for( size_t i = a.size(); i-->0; )
+    {
+      unsigned long long current = (rest << 32) | a[i];
+      a[i] = (unsigned int)(current / 1000000000);
+      rest = current % 1000000000;
+    }
+    parts.push_back( (unsigned int)rest );
+    while( !a.empty() && a.back()==0 ) a.pop_back();
+  }
+  string result = to_string( parts.back() );
+  for( size_t i = parts.size() - 1; i-->0; )
+  {
+    string part = to_string( parts[i] );
+    result += string( 9 - part.size(), '0' ) + part;
+  }
+  return result;
+}
+
+void run_machine( vector< pair<int,int> > & program )
+{
+  map<Number,Number,NumberLess> pam;
+
+  Number r[8];
+  int lr;
+  unsigned long long sum;
+
+  long long t, io;
+
+  cout << cBlue << "Uruchamianie programu." << cReset << endl;
+  lr = 0;
+  srand( time(NULL) );
+  for(int i = 0; i<8; i++ ) r[i].word = rand();
+  t = 0;
+  io = 0;
+  while( program[lr].first!=HALT )	// HALT
+  {
+    int current = lr;
+    // Rejestr z argumentu rozkazu (dla skoków nieużywany)
+    Number & x = r[program[lr].second & 7];
+    switch( program[lr].first )
+    {
+      case READ:	machine_prompt(); r[0] = read_number(); io+=100; lr++; break;
+      case WRITE:	machine_write( number_string( r[0] ) ); io+=100; lr++; break;
+
+      case LOAD:	r[0] = pam[x]; t+=50; lr++; break;
+      case STORE:	pam[x] = r[0]; t+=50; lr++; break;
+
+      case ADD:		if( r[0].big.empty() && x.big.empty() && !__builtin_add_overflow( r[0].word, x.word, &sum ) ) r[0].word = sum;
+			else add_big( r[0], x );
+			t+=5; lr++; break;
+      case SUB:		if( r[0].big.empty() && x.big.empty() ) r[0].word -= r[0].word>=x.word ? x.word : r[0].word;
+			else if( compare( r[0], x )>=0 ) sub_big( r[0], x );
+			else r[0] = Number();
+			t+=5; lr++; break;
+      case GET:		r[0] = x; t+=1; lr++; break;
+      case PUT:		x = r[0]; t+=1; lr++; break;
+      case RST:		x = Number(); t+=1; lr++; break;
+      case INC:		if( x.big.empty() && x.word!=ULLONG_MAX ) x.word++; else { Number one; one.word = 1; add_big( x, one ); }
+			t+=1; lr++; break;
+      case DEC:		if( x.big.empty() ) { if( x.word>0 ) x.word--; } else { Number one; one.word = 1; sub_big( x, one ); }
+			t+=1; lr++; break;
+      case SHL:		if( x.big.empty() && !(x.word >> 63) ) x.word<<=1; else shift_left_big( x ); t+=1; lr++; break;
+      case SHR:		if( x.big.empty() ) x.word>>=1; else shift_right_big( x ); t+=1; lr++; break;
+
+      case JUMP: 	lr = program[lr].second; t+=1; break;
+      case JPOS:	if( !is_zero( r[0] ) ) lr = program[lr].second; else lr++; t+=1; break;
+      case JZERO:	if( is_zero( r[0] ) ) lr = program[lr].second; else lr++; t+=1; break;
+
+      case STRK:	x = Number(); x.word = lr; t+=1; lr++; break;
+      case JUMPR:	lr = x.big.empty() && x.word<(unsigned long long)program.size() ? (int)x.word : -1; t+=1; break;
+
+      default: break;
+    }
+    if( profiling ) profile_step( current, lr );
+    if( lr<0 || lr>=(int)program.size() )
+      machine_error( "Wywołanie nieistniejącej instrukcji nr " + to_string( lr ) + "." );
+  }
+  machine_finish( t, io );
+}
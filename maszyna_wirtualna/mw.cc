@@ -18,6 +18,8 @@
 
 #include "instructions.hh"
 #include "colors.hh"
+#include "io.hh"
+#include "profile.hh"
 
 using namespace std;
 
@@ -38,10 +40,11 @@ void run_machine( vector< pair<int,int> > & program )
   io = 0;
   while( program[lr].first!=HALT )	// HALT
   {
+    long long current = lr;
     switch( program[lr].first )
     {
-      case READ:	cout << "? "; cin >> r[0]; io+=100; lr++; break;
-      case WRITE:	cout << "> " << r[0] << endl; io+=100; lr++; break;
+      case READ:	machine_prompt(); machine_input() >> r[0]; io+=100; lr++; break;
+      case WRITE:	machine_write( to_string( r[0] ) ); io+=100; lr++; break;
 
       case LOAD:	r[0] = pam[r[program[lr].second]]; t+=50; lr++; break;
       case STORE:	pam[r[program[lr].second]] = r[0]; t+=50; lr++; break;
@@ -65,13 +68,10 @@ void run_machine( vector< pair<int,int> > & program )
 
       default: break;
     }
+    if( profiling ) profile_step( current, lr );
     if( lr<0 || lr>=(int)program.size() )
-    {
-      cerr << cRed << "Błąd: Wywołanie nieistniejącej instrukcji nr " << lr << "." << cReset << endl;
-      exit(-1);
-    }
+      machine_error( "Wywołanie nieistniejącej instrukcji nr " + to_string( lr ) + "." );
   }
-  cout.imbue(std::locale(""));
-  cout << cBlue << "Skończono program (koszt: " << cRed << (t+io) << cBlue << "; w tym i/o: " << io << ")." << cReset << endl;
+  machine_finish( t, io );
 }
 
@@ -0,0 +1,56 @@
+/*
+ * Profil wykonania programu
+ *
+ * Dla każdej wykonanej instrukcji jest zapisywany wiersz:
+ *   numer nazwa wykonania skoki
+ * gdzie skoki to liczba wykonań, po których następną instrukcją nie była
+ * kolejna (wykonane skoki). Profil jest zapisywany na końcu programu
+ * (także po błędzie), więc kompilator może go użyć (main.py --profile-use).
+*/
+#include <cstdio>
+#include <cstdlib>
+#include <iostream>
+
+#include "profile.hh"
+#include "colors.hh"
+
+using namespace std;
+
+bool profiling = false;
+vector<unsigned long long> profile_counts;
+vector<unsigned long long> profile_taken;
+
+static char const * profile_path = NULL;
+// Kody instrukcji programu (program z main() nie istnieje już, gdy profil jest zapisywany)
+static vector<int> codes;
+
+// Nazwy instrukcji w kolejności z instructions.hh
+static char const * const names[] = { "READ", "WRITE", "LOAD", "STORE", "ADD", "SUB", "GET", "PUT", "RST", "INC",
+                                      "DEC", "SHL", "SHR", "JUMP", "JPOS", "JZERO", "STRK", "JUMPR", "HALT" };
+
+static void write_profile()
+{
+  FILE * f = fopen( profile_path, "w" );
+  if( !f )
+  {
+    cerr << cRed << "Błąd: Nie można zapisać profilu do pliku " << profile_path << cReset << endl;
+    return;
+  }
+  fprintf( f, "# instrukcja nazwa wykonania skoki\n" );
+  for( size_t i = 0; i<profile_counts.size(); i++ )
+    if( profile_counts[i]>0 )
+      fprintf( f, "%zu %s %llu %llu\n", i, names[codes[i]], profile_counts[i], profile_taken[i] );
+  fclose( f );
+}
+
+void set_profile( char const * path, vector< pair<int,int> > const & program )
+{
+  profiling = true;
+  profile_path = path;
+  codes.clear();
+  for( auto const & instruction : program ) codes.push_back( instruction.first );
+  profile_counts.assign( program.size(), 0 );
+  profile_taken.assign( program.size(), 0 );
+  // Profil jest zapisywany również wtedy, gdy maszyna kończy pracę po błędzie (exit)
+  atexit( write_profile );
+}
@@ -0,0 +1,20 @@
+/*
+ * Profil wykonania programu (--profile plik)
+*/
+#pragma once
+
+#include <utility>
+#include <vector>
+
+extern bool profiling;
+extern std::vector<unsigned long long> profile_counts;
+extern std::vector<unsigned long long> profile_taken;
+
+void set_profile( char const * path, std::vector< std::pair<int,int> > const & program );
+
+// Wykonanie instrukcji from, po której następną jest to (skok jest wykonany, gdy to != from+1)
+inline void profile_step( long long from, long long to )
+{
+  profile_counts[from]++;
+  if( to!=from+1 ) profile_taken[from]++;
+}
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import pickle
+
+import sly
+from sly.yacc import LRTable, YaccError
+
+from cache import DEFAULT_CACHE_DIR
+
+# Version of the format of the stored tables (a new version makes the old files unused)
+TABLES_VERSION = 1
+
+
+# Key of the parser's tables: the hash of its grammar (along with the version of SLY that builds the tables)
+def grammar_key(grammar):
+    digest = hashlib.sha256()
+    digest.update(f"{TABLES_VERSION}\0{sly.__version__}\0".encode())
+    digest.update(str(grammar).encode())
+    digest.update(repr(sorted(grammar.Precedence.items())).encode())
+    return digest.hexdigest()
+
+
+def load_tables(path):
+    try:
+        with open(path, 'rb') as f:
+            lr_action, lr_goto, defaulted_states = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        return None
+    return lr_action, lr_goto, defaulted_states
+
+
+# The tables are written to a temporary file first, so another compiler never reads a half-written file
+def save_tables(path, lrtable):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            pickle.dump((lrtable.lr_action, lrtable.lr_goto, lrtable.defaulted_states), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except OSError:
+        # The tables are only a speed-up, so a cache that cannot be written is not an error
+        pass
+
+
+"""
+Function responsible for building the LALR tables of the parser (called by SLY instead of Parser._build when the
+class is created). The grammar is always built from the rules (its productions hold the rules' functions), but the
+tables are the slowest part of the startup, so they are stored on the disk under the hash of the grammar and loaded
+by the next runs. Only the parts of the tables used by the parsing are kept.
+The class is created when main.py is imported, before the command line is parsed, so the tables are always kept in
+the default cache folder (--cache-dir and --no-cache do not change it).
+The grammar is built with SLY's private methods, so when they are missing or changed the parser is built by SLY
+itself (without storing the tables).
+"""
+def build_parser(cls, definitions, cache_dir=DEFAULT_CACHE_DIR):
+    try:
+        build_cached_parser(cls, definitions, cache_dir)
+    except YaccError:
+        raise
+    except Exception:
+        # SLY skips the classes that define their own _build, so it is removed before SLY's one is called
+        del cls._build
+        cls._build(definitions)
+
+
+def build_cached_parser(cls, definitions, cache_dir):
+    rules = cls._Parser__collect_rules(definitions)
+    if not cls._Parser__validate_specification():
+        raise YaccError("Invalid parser specification")
+    cls._Parser__build_grammar(rules)
+
+    path = os.path.join(cache_dir, f"parser-{grammar_key(cls._grammar)}.tables")
+    tables = load_tables(path)
+    if tables is not None:
+        lrtable = LRTable.__new__(LRTable)
+        lrtable.grammar = cls._grammar
+        lrtable.lr_productions = cls._grammar.Productions
+        lrtable.lr_action, lrtable.lr_goto, lrtable.defaulted_states = tables
+        cls._lrtable = lrtable
+        return
+
+    if not cls._Parser__build_lrtables():
+        raise YaccError("Can't build parsing tables")
+    save_tables(path, cls._lrtable)
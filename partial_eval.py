@@ -0,0 +1,241 @@
+from symbols import Array
+from procedure_symbols import ProcedureArray, ProcedureArgsArray, ProcedureArgsVariable
+
+from layout import exposed_symbols
+from call_graph import reachable_procedures
+from ranges import WORD_LIMIT
+
+# Number of commands and operations that may be done at the compile time
+MAX_STEPS = 200000
+# Number of values (written numbers and memory cells) that the folded part may leave, every one of them is a single
+# word (a bigger result is not folded), so the size of the folded code is bounded as well
+MAX_VALUES = 4096
+
+
+# The command depends on the input or cannot be done at the compile time
+class NotFoldable(Exception):
+    pass
+
+
+"""
+Class responsible for running the beginning of the main program at the compile time. The memory is a dictionary
+whose keys are (owner, name) for variables and (owner, name, index) for the arrays' elements, where the owner is
+the procedure's name (an empty string for the main program). The arguments of the procedures refer to the caller's keys.
+"""
+class PartialEvaluator:
+    """
+    PartialEvaluator's attributes are:
+    - encoders: procedures' encoders by name
+    - memory: values of the memory cells that have been set
+    - output: numbers written so far
+    - steps: number of done commands and operations
+    - exposed: locals of every procedure whose values are kept between the calls
+    - kept: procedures whose locals (kept between the calls) have been set
+    """
+    def __init__(self, encoders):
+        self.encoders = {encoder.symbols.name: encoder for encoder in encoders if encoder.is_procedure}
+        self.memory = {}
+        self.output = []
+        self.steps = 0
+        self.exposed = {name: exposed_symbols(encoder.commands) for name, encoder in self.encoders.items()}
+        self.kept = set()
+
+    def main_environment(self, symbols):
+        return {name: self.reference("", name, symbol) for name, symbol in symbols.items()}
+
+    @staticmethod
+    def reference(owner, name, symbol):
+        if type(symbol) == Array or type(symbol) == ProcedureArray:
+            return "array", (owner, name), symbol.size
+        return "cell", (owner, name)
+
+    def step(self):
+        self.steps += 1
+        if self.steps > MAX_STEPS:
+            raise NotFoldable()
+
+    def run(self, commands, environment):
+        for command in commands:
+            self.step()
+            if command[0] == "assign":
+                value = self.evaluate(command[2], environment)
+                self.store(command[1], value, environment)
+            elif command[0] == "read":
+                raise NotFoldable()
+            elif command[0] == "write":
+                self.output.append(self.evaluate(command[1], environment))
+            elif command[0] == "if":
+                if self.is_met(command[1], environment):
+                    self.run(command[2], environment)
+            elif command[0] == "ifelse":
+                self.run(command[2] if self.is_met(command[1], environment) else command[3], environment)
+            elif command[0] == "while":
+                while self.is_met(command[1], environment):
+                    self.step()
+                    self.run(command[2], environment)
+            elif command[0] == "until":
+                self.run(command[2], environment)
+                while not self.is_met(command[1], environment):
+                    self.step()
+                    self.run(command[2], environment)
+            elif command[0] == "proc_call":
+                self.call(command[1][0], command[1][1], environment)
+            else:
+                raise NotFoldable()
+
+    def call(self, name, args, environment):
+        encoder = self.encoders.get(name)
+        if encoder is None:
+            raise NotFoldable()
+        callee_environment = {}
+        for symbol_name, symbol in encoder.symbols.items():
+            if symbol_name in encoder.symbols.args:
+                argument = environment.get(args[encoder.symbols.args.index(symbol_name)])
+                # Passing an array instead of a variable (or the other way) is an error shown by the encoder
+                if argument is None or (argument[0] == "array") != (type(symbol) == ProcedureArgsArray):
+                    raise NotFoldable()
+                callee_environment[symbol_name] = argument
+            elif type(symbol) != ProcedureArgsVariable:
+                callee_environment[symbol_name] = self.reference(name, symbol_name, symbol)
+        self.run(encoder.commands, callee_environment)
+
+    def key(self, identifier, environment):
+        if type(identifier) == str:
+            reference = environment.get(identifier)
+            if reference is None or reference[0] != "cell":
+                raise NotFoldable()
+            return reference[1]
+        if identifier[0] != "array":
+            raise NotFoldable()
+        reference = environment.get(identifier[1])
+        if reference is None or reference[0] != "array":
+            raise NotFoldable()
+        index = identifier[2] if type(identifier[2]) == int else self.evaluate(identifier[2], environment)
+        if not 0 <= index < reference[2]:
+            raise NotFoldable()
+        return reference[1] + (index,)
+
+    def store(self, identifier, value, environment):
+        key = self.key(identifier, environment)
+        if key[0] != "" and key[1] in self.exposed[key[0]]:
+            self.kept.add(key[0])
+        self.memory[key] = value
+
+    def evaluate(self, expression, environment):
+        self.step()
+        if expression[0] == "const":
+            return expression[1]
+        elif expression[0] == "load":
+            key = self.key(expression[1], environment)
+            # The value of an uninitialized cell is not known
+            if key not in self.memory:
+                raise NotFoldable()
+            return self.memory[key]
+        x = self.evaluate(expression[1], environment)
+        y = self.evaluate(expression[2], environment)
+        # The same results as in the virtual machine (no negative numbers, division by zero gives zero)
+        if expression[0] == "add":
+            result = x + y
+        elif expression[0] == "sub":
+            result = max(0, x - y)
+        elif expression[0] == "mul":
+            result = x * y
+        elif expression[0] == "div":
+            result = x // y if y > 0 else 0
+        elif expression[0] == "mod":
+            result = x % y if y > 0 else 0
+        else:
+            raise NotFoldable()
+        # A number that does not fit in the machine's word is left to the machine (and its operations would slow
+        # the compiler down, e.g. squaring a number again and again)
+        if result >= WORD_LIMIT:
+            raise NotFoldable()
+        return result
+
+    def is_met(self, condition, environment):
+        x = self.evaluate(condition[1], environment)
+        y = self.evaluate(condition[2], environment)
+        return {"lt": x < y, "le": x <= y, "gt": x > y, "ge": x >= y, "eq": x == y, "ne": x != y}[condition[0]]
+
+
+# Names of the symbols and procedures used inside the commands
+def used_names(commands):
+    names = set()
+
+    def identifier(ident):
+        if type(ident) == str:
+            names.add(ident)
+        elif ident[0] == "array":
+            names.add(ident[1])
+            if type(ident[2]) == tuple:
+                expression(ident[2])
+
+    def expression(expr):
+        if expr[0] == "load":
+            identifier(expr[1])
+        elif expr[0] != "const":
+            expression(expr[1])
+            expression(expr[2])
+
+    for command in commands:
+        if command[0] in ("assign", "read"):
+            identifier(command[1])
+        if command[0] == "assign":
+            expression(command[2])
+        elif command[0] == "write":
+            expression(command[1])
+        elif command[0] in ("if", "while", "until"):
+            expression(command[1])
+            names |= used_names(command[2])
+        elif command[0] == "ifelse":
+            expression(command[1])
+            names |= used_names(command[2]) | used_names(command[3])
+        elif command[0] == "proc_call":
+            names.add(command[1][0])
+            names.update(command[1][1])
+    return names
+
+
+# Procedures that may be called by the commands (directly or not)
+def called_procedures(commands, encoders):
+    return set(reachable_procedures(used_names(commands), encoders))
+
+
+"""
+Function responsible for running the main program at the compile time up to the first command that depends
+on the input (or that takes too long). The done commands are replaced with a 'folded' command, which writes
+the same numbers and sets the memory cells that are used later. The procedures whose locals keep their values
+between the calls can be run this way only if they are not called again afterwards.
+"""
+def fold_program(encoders):
+    main = encoders[-1]
+    evaluator = PartialEvaluator(encoders)
+    environment = evaluator.main_environment(main.symbols)
+    folded = 0
+    for command in main.commands:
+        saved = dict(evaluator.memory), len(evaluator.output), set(evaluator.kept)
+        try:
+            evaluator.run([command], environment)
+        except NotFoldable:
+            evaluator.memory, evaluator.kept = saved[0], saved[2]
+            del evaluator.output[saved[1]:]
+            break
+        if len(evaluator.output) + len(evaluator.memory) > MAX_VALUES:
+            evaluator.memory, evaluator.kept = saved[0], saved[2]
+            del evaluator.output[saved[1]:]
+            break
+        folded += 1
+    # Running the commands again from the start (only when it is needed, so the states do not have to be kept)
+    while folded > 0 and evaluator.kept & called_procedures(main.commands[folded:], evaluator.encoders):
+        folded -= 1
+        evaluator = PartialEvaluator(encoders)
+        evaluator.run(main.commands[:folded], evaluator.main_environment(main.symbols))
+
+    if folded == 0:
+        return
+    used = used_names(main.commands[folded:])
+    cells = []
+    for key, value in evaluator.memory.items():
+        if key[0] == "" and key[1] in used:
+            cells.append((key[1] if len(key) == 2 else ("array", key[1], key[2]), value))
+    main.commands = [("folded", main.commands[:folded], evaluator.output, cells)] + main.commands[folded:]
@@ -0,0 +1,180 @@
+import argparse
+import bisect
+import hashlib
+import json
+
+# Instructions whose executions are the accesses to the memory
+MEMORY_INSTRUCTIONS = {"LOAD", "STORE"}
+# A loop whose instructions were never run more times than this did not repeat, so it is not worth unrolling
+COLD_LOOP_COUNT = 1
+
+
+"""
+Class responsible for the debug table of the generated code: which line (and procedure) every instruction comes from,
+which symbol every LOAD and STORE uses and where the code of every 'while' is. The encoder fills it in while the code
+is generated. The code of an inlined procedure is a fragment that is reused (by the procedure cache) and relocated at
+every call, so the fragment's own entries are copied and moved to the addresses of every copy (see 'extend'). The
+table is written next to the program, so the profile of the virtual machine (maszyna-wirtualna --profile) can be
+mapped back to the source.
+"""
+class DebugTable:
+    """
+    DebugTable's attributes are:
+    - lines: (address of the first instruction, line, procedure's name) of every piece of the code (in the order of
+      the addresses), the main program's name is an empty string
+    - accesses: (address of the LOAD or STORE, procedure's name, symbol's name) of every access to a symbol
+    - loops: (address of the first instruction, address after the last one, line) of every encoded 'while'
+    """
+    def __init__(self, lines=(), accesses=(), loops=()):
+        self.lines = [tuple(line) for line in lines]
+        self.accesses = [tuple(access) for access in accesses]
+        self.loops = [tuple(loop) for loop in loops]
+
+    def add_line(self, address, lineno, procedure):
+        if self.lines and self.lines[-1][1:] == (lineno, procedure):
+            return
+        # A piece without any instructions is replaced by the next one
+        if self.lines and self.lines[-1][0] == address:
+            self.lines.pop()
+        self.lines.append((address, lineno, procedure))
+
+    # The address of the symbol is created, so the next instruction (if it is LOAD or STORE) accesses the symbol
+    def add_access(self, address, procedure, symbol):
+        self.accesses.append((address, procedure, symbol))
+
+    def add_loop(self, start, end, lineno):
+        self.loops.append((start, end, lineno))
+
+    # Adding the entries of a piece of the code encoded on its own (e.g. an inlined procedure) placed at the offset
+    def extend(self, other, offset):
+        for address, lineno, procedure in other.lines:
+            self.add_line(address + offset, lineno, procedure)
+        for address, procedure, symbol in other.accesses:
+            self.add_access(address + offset, procedure, symbol)
+        for start, end, lineno in other.loops:
+            self.add_loop(start + offset, end + offset, lineno)
+
+    # Forgetting the code from the address on (it was dropped by the encoder)
+    def drop(self, address):
+        self.lines = [line for line in self.lines if line[0] < address]
+        self.accesses = [access for access in self.accesses if access[0] < address]
+        self.loops = [loop for loop in self.loops if loop[0] < address]
+
+    # Returns (line, procedure's name) of the instruction (None if it comes before the first line)
+    def line_of(self, address):
+        i = bisect.bisect_right(self.lines, (address, float("inf")))
+        return self.lines[i - 1][1:] if i > 0 else None
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({"lines": self.lines, "accesses": self.accesses, "loops": self.loops}, f)
+
+    @staticmethod
+    def read(path):
+        with open(path) as f:
+            data = json.load(f)
+        return DebugTable(data["lines"], data["accesses"], data["loops"])
+
+
+"""
+Class responsible for the profile written by the virtual machine (maszyna-wirtualna --profile), read along with the
+debug table of the profiled code. The profile has a line 'address name executions taken' for every executed instruction
+('taken' is the number of the executions after which the next instruction was not the following one).
+"""
+class Profile:
+    """
+    Profile's attributes are:
+    - instructions: (name, executions, taken jumps) of every executed instruction by its address
+    - table: debug table of the profiled code
+    - digest: hash of the profile and the table (part of the compile cache key)
+    """
+    def __init__(self, profile_path, table_path):
+        digest = hashlib.sha256()
+        self.instructions = {}
+        with open(profile_path) as f:
+            for line in f:
+                digest.update(line.encode())
+                if line.startswith("#") or not line.strip():
+                    continue
+                address, name, count, taken = line.split()
+                self.instructions[int(address)] = name, int(count), int(taken)
+        with open(table_path, 'rb') as f:
+            digest.update(f.read())
+        self.digest = digest.hexdigest()
+        self.table = DebugTable.read(table_path)
+
+    # Number of the executions of the code of every line, as (procedure's name, line) -> executed instructions
+    def line_counts(self):
+        counts = {}
+        for address, (_, count, _) in self.instructions.items():
+            line = self.table.line_of(address)
+            if line is not None:
+                key = line[1], line[0]
+                counts[key] = counts.get(key, 0) + count
+        return counts
+
+    """
+    Function responsible for the weights of the memory layout: every symbol gets the number of its executed LOADs and
+    STOREs (the accesses to the arguments of the procedures are already the accesses to the callers' symbols). The
+    symbols added by the compiler are not in the source (and they may be different in the profiled code), so they are
+    left out and the layout counts them itself.
+    """
+    def symbol_weights(self, encoders, tokens):
+        names = {tok.value for tok in tokens if tok.type == "PID"}
+
+        weights = {}
+        for address, procedure, symbol in self.table.accesses:
+            name, count, _ = self.instructions.get(address, (None, 0, 0))
+            if name in MEMORY_INSTRUCTIONS and symbol in names:
+                weights[(procedure, symbol)] = weights.get((procedure, symbol), 0) + count
+
+        # The symbols of the source that were never accessed in the profile are not used
+        for encoder in encoders:
+            name = encoder.symbols.name if encoder.is_procedure else ""
+            for symbol in encoder.symbols:
+                if symbol in names:
+                    weights.setdefault((name, symbol), 0)
+        return weights
+
+    # Loops (from 'loop_lines') whose code was run but never repeated, as the set of their commands' ids
+    def cold_loops(self, loops):
+        executions = {}
+        for start, end, lineno in self.table.loops:
+            count = max((self.instructions[address][1] for address in range(start, end) if address in self.instructions),
+                        default=0)
+            executions[lineno] = max(executions.get(lineno, 0), count)
+        return {id(command) for command, lineno in loops if executions.get(lineno, COLD_LOOP_COUNT + 1) <= COLD_LOOP_COUNT}
+
+
+"""
+Function responsible for finding the line of every 'while' of the program (before the uncalled procedures are removed).
+The encoders and their commands are in the order of the source, so the loops are matched with the WHILE tokens in order.
+"""
+def loop_lines(encoders, tokens):
+    loops = []
+
+    def walk(commands):
+        for command in commands:
+            if command[0] == "while":
+                loops.append(command)
+            if command[0] in ("if", "while", "until"):
+                walk(command[2])
+            elif command[0] == "ifelse":
+                walk(command[2])
+                walk(command[3])
+
+    for encoder in encoders:
+        walk(encoder.commands)
+    return list(zip(loops, [tok.lineno for tok in tokens if tok.type == "WHILE"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shows the lines of the program that were run the most in the profile.")
+    parser.add_argument("profile_file", help="profile written by the virtual machine (--profile)")
+    parser.add_argument("table_file", help="debug table of the profiled program (main.py --debug-table)")
+    parser.add_argument("--top", type=int, default=20, help="number of the shown lines")
+    args = parser.parse_args()
+
+    counts = Profile(args.profile_file, args.table_file).line_counts()
+    for (procedure, lineno), count in sorted(counts.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"line {lineno} ({procedure or 'main program'}): {count} instructions")
@@ -1,4 +1,4 @@
-from globals import get_global_consts_address, modify_global_consts_address, get_global_command_lineno
+from globals import get_global_command_lineno
 
 
 class ProcedureArray:
@@ -66,7 +66,6 @@ class ProcedureSymbols(dict):
         self.start_address = 0
         self.end_address = 0
         self.args = []
-        self.consts = {}
 
     def set_procedure_name(self, name):
         self.name = name
@@ -101,12 +100,6 @@ class ProcedureSymbols(dict):
         self.setdefault(name, ProcedureArray(name, self.memory_offset + offset, size))
         self.memory_offset += size
 
-    def add_const(self, value):
-        available_address = get_global_consts_address()
-        self.consts.setdefault(value, available_address)
-        modify_global_consts_address(available_address + 1)
-        return available_address
-
     def get_variable(self, name):
         if name in self:
             return self[name]
@@ -126,8 +119,4 @@ class ProcedureSymbols(dict):
         if type(target) == str:
             return self.get_variable(target).memory_offset
         else:
-            return self.get_array_at(target[0], target[1])
-
-    def get_const(self, val):
-        if val in self.consts:
-            return self.consts[val]
\ No newline at end of file
+            return self.get_array_at(target[0], target[1])
\ No newline at end of file
@@ -0,0 +1,236 @@
+from unroll import changed_symbols
+
+# The numbers of the virtual machine (mw.cc) are 64-bit, so a bound that does not fit is not known (it may wrap)
+WORD_LIMIT = 2 ** 64
+# Range of a number that is not known at all: (lowest value, highest value or None if there is no bound)
+UNKNOWN = (0, None)
+
+
+def exact(value):
+    return (value, value) if value < WORD_LIMIT else UNKNOWN
+
+
+def bounded(low, high):
+    if high is not None and high >= WORD_LIMIT:
+        return UNKNOWN
+    return low, high
+
+
+def join(first, second):
+    if first is None:
+        return second
+    if second is None:
+        return first
+    high = None if first[1] is None or second[1] is None else max(first[1], second[1])
+    return min(first[0], second[0]), high
+
+
+# Number of bits that the highest value of the range takes (None if it has no bound), the higher bits are known zeros
+def bit_length(bounds):
+    return None if bounds[1] is None else bounds[1].bit_length()
+
+
+def is_nonzero(bounds):
+    return bounds[0] > 0
+
+
+# Range of the result of the operation for any numbers from the ranges of its operands
+def operation_range(operation, first, second):
+    (low1, high1), (low2, high2) = first, second
+    if operation == "add":
+        return bounded(low1 + low2, None if high1 is None or high2 is None else high1 + high2)
+    if operation == "sub":
+        return bounded(max(0, low1 - high2) if high2 is not None else 0,
+                       None if high1 is None else max(0, high1 - low2))
+    if operation == "mul":
+        return bounded(low1 * low2, None if high1 is None or high2 is None else high1 * high2)
+    if operation == "div":
+        # Division by zero gives zero
+        low = 0 if low2 == 0 or high2 is None else low1 // high2
+        return bounded(low, None if high1 is None else high1 // max(1, low2))
+    if operation == "mod":
+        if high2 == 0:
+            return 0, 0
+        highs = [high for high in (high1, None if high2 is None else high2 - 1) if high is not None]
+        low = low1 if high2 is not None and high1 is not None and high1 < low2 else 0
+        return bounded(low, min(highs) if highs else None)
+    return UNKNOWN
+
+
+# Names of the operations on the other side of the comparison and of the opposite comparisons
+SWAPPED = {"lt": "gt", "le": "ge", "gt": "lt", "ge": "le", "eq": "eq", "ne": "ne"}
+NEGATED = {"lt": "ge", "le": "gt", "gt": "le", "ge": "lt", "eq": "ne", "ne": "eq"}
+
+
+"""
+Class responsible for the ranges of the values (intervals, the bit length of the highest value tells which high bits
+are known to be zero) of the variables of one encoder. The commands are gone through once in the order of the code:
+an assignment gives the variable the range of its expression (constants, sums, products, quotients and remainders of
+the operands' ranges), a condition narrows the ranges of the compared variables inside the branches and after the
+loops (e.g. the counter of 'WHILE i < 8' is at most 7 inside the loop). A loop starts with no ranges for the
+variables it changes, so they hold for every iteration without finding a fixed point. Every multiplication, division
+and remainder gets the ranges of its operands (joined, if it is encoded more than once), so the encoder can leave out
+the checks that cannot fail. The arrays' elements are never known. The arguments of a procedure may be the same
+variable of the caller, so changing one of them makes the others unknown.
+"""
+class RangeAnalysis:
+    """
+    RangeAnalysis's attributes are:
+    - arguments: names of the procedure's arguments (empty for the main program)
+    - operands: ranges of the operands of every multiplication, division and remainder by the id of its expression
+    """
+    def __init__(self, arguments=()):
+        self.arguments = set(arguments)
+        self.operands = {}
+
+    def value_range(self, value, state):
+        if value[0] == "const":
+            return exact(value[1])
+        if type(value[1]) == str:
+            return state.get(value[1], UNKNOWN)
+        return UNKNOWN
+
+    def expression_range(self, expression, state):
+        if expression[0] in ("const", "load"):
+            return self.value_range(expression, state)
+        first = self.value_range(expression[1], state)
+        second = self.value_range(expression[2], state)
+        if expression[0] in ("mul", "div", "mod"):
+            previous = self.operands.get(id(expression))
+            if previous is not None:
+                first, second = join(previous[0], first), join(previous[1], second)
+            self.operands[id(expression)] = first, second
+        return operation_range(expression[0], first, second)
+
+    # The variables (and the arguments that may be the same variables) get no range
+    def forget(self, state, names):
+        if state is None:
+            return None
+        state = dict(state)
+        for name in names:
+            state.pop(name, None)
+            if name in self.arguments:
+                for argument in self.arguments:
+                    state.pop(argument, None)
+        return state
+
+    def assign(self, state, name, bounds):
+        state = self.forget(state, [name])
+        if bounds != UNKNOWN:
+            state[name] = bounds
+        return state
+
+    """
+    Returns the state in which the condition is met (or not met, if 'truth' is False), None if it can never be.
+    Only the variables compared with the other value are narrowed.
+    """
+    def refine(self, condition, state, truth=True):
+        if state is None:
+            return None
+        operation, first, second = condition
+        if not truth:
+            operation = NEGATED[operation]
+        (low1, high1), (low2, high2) = self.value_range(first, state), self.value_range(second, state)
+
+        if operation in ("gt", "ge"):
+            operation = SWAPPED[operation]
+            first, second = second, first
+            (low1, high1), (low2, high2) = (low2, high2), (low1, high1)
+        if operation == "lt":
+            # first < second
+            new_first = (low1, high2 - 1 if high1 is None and high2 is not None else
+                         high1 if high2 is None else min(high1, high2 - 1))
+            new_second = (max(low2, low1 + 1), high2)
+        elif operation == "le":
+            new_first = (low1, high2 if high1 is None else high1 if high2 is None else min(high1, high2))
+            new_second = (max(low2, low1), high2)
+        elif operation == "eq":
+            high = high2 if high1 is None else high1 if high2 is None else min(high1, high2)
+            new_first = new_second = (max(low1, low2), high)
+        else:
+            # Only a value equal to the bound of the other range can be left out of it
+            new_first, new_second = (low1, high1), (low2, high2)
+            if low2 == high2:
+                new_first = (low1 + (low1 == low2), high1 if high1 != low2 else high1 - 1)
+            if low1 == high1:
+                new_second = (low2 + (low2 == low1), high2 if high2 != low1 else high2 - 1)
+
+        for value, bounds in ((first, new_first), (second, new_second)):
+            if bounds[1] is not None and bounds[0] > bounds[1]:
+                return None
+            if value[0] == "load" and type(value[1]) == str:
+                state = dict(state)
+                state[value[1]] = bounds
+        return state
+
+    def join_states(self, first, second):
+        if first is None:
+            return second
+        if second is None:
+            return first
+        return {name: join(first[name], second[name]) for name in first if name in second}
+
+    def analyze(self, commands, state):
+        for command in commands:
+            state = self.analyze_command(command, state)
+        return state
+
+    # Returns the state after the command (None if the command is never finished)
+    def analyze_command(self, command, state):
+        if command[0] == "assign":
+            bounds = self.expression_range(command[2], state if state is not None else {})
+            if type(command[1]) == str:
+                return self.assign(state, command[1], bounds) if state is not None else None
+            return state
+        elif command[0] == "read":
+            return self.forget(state, [command[1]]) if type(command[1]) == str else state
+        elif command[0] == "proc_call":
+            return self.forget(state, command[1][1])
+        elif command[0] == "if":
+            inside = self.analyze(command[2], self.refine(command[1], state))
+            return self.join_states(inside, self.refine(command[1], state, False))
+        elif command[0] == "ifelse":
+            inside = self.analyze(command[2], self.refine(command[1], state))
+            outside = self.analyze(command[3], self.refine(command[1], state, False))
+            return self.join_states(inside, outside)
+        elif command[0] == "while":
+            return self.analyze_loop(command[1], [command[2]], state)
+        elif command[0] == "until":
+            start = self.forget(state, changed_symbols(command[2]))
+            return self.refine(command[1], self.analyze(command[2], start))
+        elif command[0] == "unrolled":
+            _, setup, condition, copies, rest = command
+            state = self.analyze(setup, state)
+            if condition is None:
+                for copy in copies:
+                    state = self.analyze(copy, state)
+            else:
+                state = self.analyze_loop(condition, copies, state)
+            return self.analyze_command(rest, state) if rest is not None else state
+        elif command[0] == "folded":
+            # The memory cells of the variables are set to the values computed by the compiler
+            state = self.analyze(command[1], state)
+            for identifier, value in command[3]:
+                if type(identifier) == str:
+                    state = self.assign(state if state is not None else {}, identifier, exact(value))
+            return state
+        return state
+
+    # A loop doing the blocks one after another as long as the condition is met (checked before the first one)
+    def analyze_loop(self, condition, blocks, state):
+        changed = set()
+        for block in blocks:
+            changed |= changed_symbols(block)
+        start = self.forget(state, changed)
+        inside = self.refine(condition, start)
+        for block in blocks:
+            inside = self.analyze(block, inside)
+        return self.refine(condition, start, False)
+
+
+# Gives every encoder the ranges of the operands of its multiplications, divisions and remainders
+def analyze_ranges(encoders):
+    for encoder in encoders:
+        analysis = RangeAnalysis(encoder.symbols.args if encoder.is_procedure else ())
+        analysis.analyze(encoder.commands, {})
+        encoder.ranges = analysis.operands
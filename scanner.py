@@ -0,0 +1,183 @@
+import re
+
+from sly.lex import Token
+
+# Classes of the characters
+UPPER, WORD, DIGIT, BLANK, COMMENT, OPERATOR, LITERAL, INVALID = range(8)
+
+UPPER_RUN = re.compile(r'[A-Z]+').match
+WORD_RUN = re.compile(r'[_a-z]+').match
+DIGIT_RUN = re.compile(r'\d+').match
+
+
+"""
+Class responsible for the fast tokenizing of the source. SLY tries the patterns of all the tokens one after another at
+every position, so instead every run of the characters of the same class (found by the table of the classes) is
+matched once: a run of small letters is a PID, a run of digits is a NUM and a run of capital letters is looked up in
+the dictionary of the keywords. A run that is not a single keyword (e.g. 'ENDIFEND') is split in the order of the
+lexer's rules, so the tokens (along with their lines and positions) are always the same as the ones of SLY.
+The keywords, the operators, the literals and the ignored characters are taken from the lexer's class.
+"""
+class Scanner:
+    """
+    Scanner's attributes are:
+    - keywords: token of every keyword (the patterns made of capital letters, e.g. 'T' as well) that is matched as a
+      whole by the rules
+    - prefixes: (pattern, token) of the keywords in the order of the lexer's rules
+    - operators: (pattern, token) of the operators starting with every character, in the order of the lexer's rules
+    - blank_run: matches the run of the ignored characters and the new lines
+    - classes: class of every ASCII character
+    """
+    def __init__(self, lexer_class):
+        self.prefixes = [(pattern, name) for name, pattern in lexer_class._rules
+                         if isinstance(pattern, str) and re.fullmatch(r'[A-Z]+', pattern)]
+        # A keyword that starts with an earlier one (e.g. 'ENDIF' if 'END' came first) is always split by the rules
+        self.keywords = {}
+        for pattern, name in self.prefixes:
+            if self.split_run(pattern, 0, len(pattern)) == [(name, 0, len(pattern))]:
+                self.keywords[pattern] = name
+        self.blank_run = re.compile(f"[{re.escape(lexer_class.ignore)}\\n]+").match
+        self.operators = {}
+        for name, pattern in lexer_class._rules:
+            if isinstance(pattern, str) and re.fullmatch(r'[:<>=!]+', pattern):
+                self.operators.setdefault(pattern[0], []).append((pattern, name))
+
+        self.classes = {}
+        for code in range(128):
+            character = chr(code)
+            if 'A' <= character <= 'Z':
+                self.classes[character] = UPPER
+            elif 'a' <= character <= 'z' or character == '_':
+                self.classes[character] = WORD
+            elif character.isdigit():
+                self.classes[character] = DIGIT
+            elif character in lexer_class.ignore or character == '\n':
+                self.classes[character] = BLANK
+            elif character == '#':
+                self.classes[character] = COMMENT
+            elif character in self.operators:
+                self.classes[character] = OPERATOR
+            elif character in lexer_class.literals:
+                self.classes[character] = LITERAL
+            else:
+                self.classes[character] = INVALID
+
+    # Class of a character that is not in the table (not an ASCII one)
+    @staticmethod
+    def character_class(character):
+        # Digits of the other alphabets are digits for the regular expressions of SLY as well
+        return DIGIT if character.isdecimal() else INVALID
+
+    # Tokens (type, start, end) of a run of capital letters that is not a single keyword, up to the first position
+    # that starts no keyword
+    def split_run(self, text, index, end):
+        parts = []
+        while index < end:
+            for pattern, name in self.prefixes:
+                if text.startswith(pattern, index):
+                    parts.append((name, index, index + len(pattern)))
+                    index += len(pattern)
+                    break
+            else:
+                break
+        return parts
+
+    """
+    Generates the tokens of the text, the same way as Lexer.tokenize of SLY (the lexer's line and position are
+    updated, and an invalid character is passed to the lexer's 'error').
+    """
+    def tokenize(self, lexer, text, lineno=1, index=0):
+        classes = self.classes
+        keywords = self.keywords
+        blank_run = self.blank_run
+        length = len(text)
+        try:
+            while index < length:
+                character = text[index]
+                kind = classes.get(character)
+                if kind is None:
+                    kind = self.character_class(character)
+
+                if kind == BLANK:
+                    end = blank_run(text, index).end()
+                    lineno += text.count('\n', index, end)
+                    index = end
+                    continue
+                if kind == COMMENT:
+                    end = text.find('\n', index)
+                    index = end if end >= 0 else length
+                    continue
+
+                name = None
+                if kind == WORD:
+                    end = WORD_RUN(text, index).end()
+                    name = "PID"
+                    value = text[index:end]
+                elif kind == DIGIT:
+                    end = DIGIT_RUN(text, index).end()
+                    name = "NUM"
+                    value = int(text[index:end])
+                elif kind == UPPER:
+                    end = UPPER_RUN(text, index).end()
+                    value = text[index:end]
+                    name = keywords.get(value)
+                    if name is None:
+                        parts = self.split_run(text, index, end)
+                        for part, start, stop in parts:
+                            tok = Token()
+                            tok.type = part
+                            tok.value = text[start:stop]
+                            tok.lineno = lineno
+                            tok.index = start
+                            tok.end = stop
+                            yield tok
+                        # The rest of the run is tokenized again (it starts with an invalid character)
+                        if parts:
+                            index = parts[-1][2]
+                            continue
+                elif kind == OPERATOR:
+                    for pattern, operator in self.operators[character]:
+                        if text.startswith(pattern, index):
+                            name = operator
+                            value = pattern
+                            end = index + len(pattern)
+                            break
+                elif kind == LITERAL:
+                    name = value = character
+                    end = index + 1
+
+                tok = Token()
+                tok.lineno = lineno
+                tok.index = index
+                if name is None:
+                    # A lexing error
+                    lexer.index = index
+                    lexer.lineno = lineno
+                    tok.type = 'ERROR'
+                    tok.value = text[index:]
+                    tok = lexer.error(tok)
+                    if tok is not None:
+                        tok.end = lexer.index
+                        yield tok
+                    index = lexer.index
+                    lineno = lexer.lineno
+                    continue
+                tok.type = name
+                tok.value = value
+                tok.end = index = end
+                yield tok
+        finally:
+            lexer.text = text
+            lexer.index = index
+            lexer.lineno = lineno
+
+
+SCANNERS = {}
+
+
+# Tokenizes the text with the scanner of the lexer's class (it is built at the first use)
+def scan(lexer, text, lineno=1, index=0):
+    lexer_class = type(lexer)
+    if lexer_class not in SCANNERS:
+        SCANNERS[lexer_class] = Scanner(lexer_class)
+    return SCANNERS[lexer_class].tokenize(lexer, text, lineno, index)
@@ -0,0 +1,247 @@
+import argparse
+import random
+import re
+import sys
+
+from writer import OPCODES, REGISTERS, BINARY_MAGIC
+
+# Names of the instructions by their codes (maszyna_wirtualna/instructions.hh)
+INSTRUCTION_NAMES = {code: name for name, code in OPCODES.items()}
+# Instructions that take a register (the other ones with an argument take the number of an instruction)
+REGISTER_INSTRUCTIONS = {"LOAD", "STORE", "ADD", "SUB", "GET", "PUT", "RST", "INC", "DEC", "SHL", "SHR", "STRK", "JUMPR"}
+# Instructions after which the next instruction starts a new basic block
+BLOCK_ENDS = {"JUMP", "JPOS", "JZERO", "JUMPR", "HALT"}
+# Costs of the instructions in the virtual machine (READ and WRITE are counted as the input/output)
+COSTS = {"LOAD": 50, "STORE": 50, "ADD": 5, "SUB": 5, "READ": 100, "WRITE": 100, "HALT": 0}
+IO_INSTRUCTIONS = {"READ", "WRITE"}
+
+
+class SimulationError(Exception):
+    pass
+
+
+# Reads the program written by the compiler (in the text or the binary format) as a list of (instruction, argument)
+def load_program(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+        return decode_binary(data)
+    return parse_text(data.decode())
+
+
+def parse_text(text):
+    program = []
+    tokens = re.sub(r"#.*", "", text).split()
+    i = 0
+    while i < len(tokens):
+        name = tokens[i]
+        if name not in OPCODES:
+            raise SimulationError(f"Unknown instruction {name}")
+        operand = 0
+        if name not in ("READ", "WRITE", "HALT"):
+            i += 1
+            operand = REGISTERS[tokens[i]] if tokens[i] in REGISTERS else int(tokens[i])
+        program.append((name, operand))
+        i += 1
+    return program
+
+
+def decode_binary(data):
+    count = int.from_bytes(data[4:12], "little")
+    program = []
+    position = 4 + 8 + 8
+    for _ in range(count):
+        name = INSTRUCTION_NAMES[data[position]]
+        position += 1
+        # The argument is a varint (seven bits per byte, the lowest ones first)
+        operand = 0
+        shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            operand |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        program.append((name, operand))
+    return program
+
+
+# First instructions of the basic blocks (the program's start, the jumps' targets and the instructions after the jumps)
+def find_leaders(program):
+    leaders = {0}
+    for i, (name, operand) in enumerate(program):
+        if name in ("JUMP", "JPOS", "JZERO"):
+            leaders.add(operand)
+        if name in BLOCK_ENDS:
+            leaders.add(i + 1)
+    return {leader for leader in leaders if leader < len(program)}
+
+
+"""
+Class responsible for running the programs of the virtual machine quickly. The program is split into basic blocks
+(they start at the jumps' targets and after the jumps), and every block is translated once into a Python function
+whose registers are local variables. The function returns the number of the next block's first instruction, so the
+blocks are chained by their indexes. The cost of every block is computed once and added when the block is run
+(the jumps cost the same whether they are taken or not), so it is always equal to the cost counted by the virtual
+machine. The numbers are not limited, like in the version of the machine with the big numbers (mw-cln.cc).
+"""
+class BlockSimulator:
+    """
+    BlockSimulator's attributes are:
+    - program: list of instructions as (name, argument)
+    - blocks: function of the block starting at every instruction (None if the block has not been translated yet)
+    - times: cost of every block without the input/output
+    - io: cost of the input/output of every block
+    - leaders: first instructions of the blocks
+    - counts: how many times every block was run (during the last run)
+    """
+    def __init__(self, program):
+        self.program = program
+        self.blocks = [None] * len(program)
+        self.times = [0] * len(program)
+        self.io = [0] * len(program)
+        self.counts = [0] * len(program)
+
+        self.leaders = find_leaders(program)
+        # All blocks known in advance are compiled together (the other ones, reached by JUMPR, when they are needed)
+        self.translate(sorted(self.leaders))
+
+    def translate(self, starts):
+        source = []
+        for start in starts:
+            source += self.block_source(start)
+        namespace = {}
+        exec(compile("\n".join(source), "<simulated program>", "exec"), namespace)
+        for start in starts:
+            self.blocks[start] = namespace[f"block_{start}"]
+
+    # Generates the function of the block starting at the instruction
+    def block_source(self, start):
+        body = []
+        used = set()
+        changed = set()
+        end = start
+        next_instruction = None
+        while True:
+            name, operand = self.program[end]
+            register = "abcdefgh"[operand] if name in REGISTER_INSTRUCTIONS and operand < 8 else None
+            self.times[start] += 0 if name in IO_INSTRUCTIONS else COSTS.get(name, 1)
+            self.io[start] += COSTS[name] if name in IO_INSTRUCTIONS else 0
+            if name in ("READ", "GET", "LOAD", "ADD", "SUB"):
+                changed.add("a")
+            if name in ("PUT", "RST", "INC", "DEC", "SHL", "SHR", "STRK"):
+                changed.add(register)
+            if register is not None:
+                used.add(register)
+            if name in ("WRITE", "LOAD", "STORE", "ADD", "SUB", "PUT", "JPOS", "JZERO"):
+                used.add("a")
+
+            if name == "READ":
+                body.append("a = read()")
+            elif name == "WRITE":
+                body.append("write(a)")
+            elif name == "LOAD":
+                body.append(f"a = memory.get({register}, 0)")
+            elif name == "STORE":
+                body.append(f"memory[{register}] = a")
+            elif name == "ADD":
+                body.append(f"a += {register}")
+            elif name == "SUB":
+                body.append(f"a = a - {register} if a >= {register} else 0")
+            elif name == "GET":
+                body.append(f"a = {register}")
+            elif name == "PUT":
+                body.append(f"{register} = a")
+            elif name == "RST":
+                body.append(f"{register} = 0")
+            elif name == "INC":
+                body.append(f"{register} += 1")
+            elif name == "DEC":
+                body.append(f"{register} = {register} - 1 if {register} > 0 else 0")
+            elif name == "SHL":
+                body.append(f"{register} <<= 1")
+            elif name == "SHR":
+                body.append(f"{register} >>= 1")
+            elif name == "STRK":
+                body.append(f"{register} = {end}")
+            elif name == "JUMP":
+                next_instruction = f"{operand}"
+            elif name == "JPOS":
+                next_instruction = f"{operand} if a > 0 else {end + 1}"
+            elif name == "JZERO":
+                next_instruction = f"{operand} if a == 0 else {end + 1}"
+            elif name == "JUMPR":
+                next_instruction = register
+            elif name == "HALT":
+                next_instruction = "None"
+
+            end += 1
+            if next_instruction is not None:
+                break
+            if end in self.leaders or end == len(self.program):
+                next_instruction = f"{end}"
+                break
+
+        lines = [f"def block_{start}(registers, memory, read, write):"]
+        used = sorted(used | changed)
+        if used:
+            lines.append(f"    {', '.join(used)}, = {', '.join(f'registers[{REGISTERS[r]}]' for r in used)},")
+        lines += [f"    {line}" for line in body]
+        # The register has to be read before the other ones are written back (JUMPR)
+        lines.append(f"    next_instruction = {next_instruction}")
+        if changed:
+            changed = sorted(changed)
+            lines.append(f"    {', '.join(f'registers[{REGISTERS[r]}]' for r in changed)}, = {', '.join(changed)},")
+        lines.append("    return next_instruction")
+        return lines
+
+    """
+    Runs the program with the given input numbers and returns the written numbers, the cost and the cost of the
+    input/output. The registers start with random values, like in the virtual machine, unless they are given.
+    The blocks are only counted while the program runs, the costs are summed up at the end.
+    """
+    def run(self, inputs=(), registers=None):
+        inputs = iter(inputs)
+        output = []
+
+        def read():
+            value = next(inputs, None)
+            if value is None:
+                raise SimulationError("Not enough input numbers")
+            return value
+
+        registers = list(registers) if registers is not None else [random.randrange(2 ** 31) for _ in range(8)]
+        memory = {}
+        blocks = self.blocks
+        counts = self.counts = [0] * len(blocks)
+        write = output.append
+        instruction = 0
+        try:
+            while instruction is not None:
+                block = blocks[instruction]
+                if block is None:
+                    # A block started by JUMPR in the middle of another one
+                    self.translate([instruction])
+                    block = blocks[instruction]
+                counts[instruction] += 1
+                instruction = block(registers, memory, read, write)
+        except IndexError:
+            raise SimulationError(f"Call of a nonexistent instruction {instruction}") from None
+        io_cost = sum(count * cost for count, cost in zip(counts, self.io) if count)
+        time = sum(count * cost for count, cost in zip(counts, self.times) if count)
+        return output, time + io_cost, io_cost
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs a program of the virtual machine (text or binary).")
+    parser.add_argument("program_file", help="compiled program")
+    parser.add_argument("--input", help="file with the input numbers (the standard input by default)")
+    args = parser.parse_args()
+
+    with (open(args.input) if args.input else sys.stdin) as f:
+        numbers = [int(token) for token in f.read().split()]
+    written, cost, io_cost = BlockSimulator(load_program(args.program_file)).run(numbers)
+    for number in written:
+        print(f"> {number}")
+    print(f"Finished (cost: {cost}; i/o: {io_cost})")
@@ -0,0 +1,131 @@
+import contextlib
+import time
+
+from globals import get_compiler_stats
+
+# Order in which the phases are reported
+PHASES = ["cache", "lex", "parse", "fold", "unroll", "ranges", "layout", "encode", "link", "write"]
+
+
+class PhaseRecord:
+    def __init__(self):
+        self.time = 0.0
+        self.peak_memory = 0
+        self.calls = 0
+
+    def as_dict(self):
+        return {"time": self.time, "peak_memory": self.peak_memory, "calls": self.calls}
+
+
+# Class responsible for measuring how much time and memory every phase of the compilation takes
+class CompilerStats:
+    """
+    CompilerStats's attributes are:
+    - phases: time (without the time of the nested phases) and peak memory of every phase
+    - procedures: the same for the encoding of every procedure, along with its instructions and inline expansions
+    - instructions: number of instructions of the whole program
+    - inline_expansions: number of procedure calls replaced with the procedure's code (None if the program was taken
+      from the compile cache)
+    - cache_hit: whether the program was taken from the compile cache
+    - peak_memory: peak memory of the whole compilation
+    - stack: currently measured phases (the innermost one is the last)
+    - tracemalloc: module measuring the memory (imported only when the statistics are collected, like json)
+    """
+    def __init__(self):
+        self.phases = {}
+        self.procedures = {}
+        self.instructions = 0
+        self.inline_expansions = 0
+        self.cache_hit = False
+        self.peak_memory = 0
+        self.stack = []
+        self.start = time.perf_counter()
+        import tracemalloc
+        self.tracemalloc = tracemalloc
+        tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name, procedure=None):
+        if procedure is None:
+            record = self.phases.setdefault(name, PhaseRecord())
+        else:
+            record = self.procedures.setdefault(procedure, ProcedureRecord())
+        # The peak of the outer phase so far is saved before it is reset for the inner one
+        if self.stack:
+            self.stack[-1][0].peak_memory = max(self.stack[-1][0].peak_memory, self.tracemalloc.get_traced_memory()[1])
+        self.tracemalloc.reset_peak()
+        entry = [record, time.perf_counter(), 0.0]
+        self.stack.append(entry)
+        try:
+            yield record
+        finally:
+            self.stack.pop()
+            elapsed = time.perf_counter() - entry[1]
+            record.time += elapsed - entry[2]
+            record.calls += 1
+            peak = self.tracemalloc.get_traced_memory()[1]
+            record.peak_memory = max(record.peak_memory, peak)
+            self.peak_memory = max(self.peak_memory, peak)
+            # The outer phase does not count the inner one's time, but its memory does
+            if self.stack:
+                self.stack[-1][2] += elapsed
+                self.stack[-1][0].peak_memory = max(self.stack[-1][0].peak_memory, peak)
+
+    def add_inline_expansion(self, procedure, instructions):
+        self.inline_expansions += 1
+        record = self.procedures.setdefault(procedure, ProcedureRecord())
+        record.inline_expansions += 1
+        record.instructions += instructions
+
+    def as_dict(self):
+        return {
+            "total_time": time.perf_counter() - self.start,
+            "peak_memory": max(self.peak_memory, self.tracemalloc.get_traced_memory()[1]),
+            "phases": {name: self.phases[name].as_dict() for name in self.ordered_phases()},
+            "procedures": {name: record.as_dict() for name, record in self.procedures.items()},
+            "instructions": self.instructions,
+            "inline_expansions": self.inline_expansions,
+            "cache_hit": self.cache_hit,
+        }
+
+    def ordered_phases(self):
+        return [name for name in PHASES if name in self.phases] + [name for name in self.phases if name not in PHASES]
+
+    def report(self):
+        stats = self.as_dict()
+        lines = [f"Total time: {stats['total_time'] * 1000:.2f} ms, peak memory: {stats['peak_memory'] / 1024:.1f} KiB"]
+        for name, phase in stats["phases"].items():
+            lines.append(f"  {name:<10} {phase['time'] * 1000:10.2f} ms {phase['peak_memory'] / 1024:10.1f} KiB")
+        for name, procedure in stats["procedures"].items():
+            lines.append(f"  procedure {name}: {procedure['time'] * 1000:.2f} ms, {procedure['instructions']} instructions, "
+                         f"{procedure['inline_expansions']} inline expansions")
+        if stats['cache_hit']:
+            lines.append(f"Instructions: {stats['instructions']} (taken from the cache)")
+        else:
+            lines.append(f"Instructions: {stats['instructions']}, inline expansions: {stats['inline_expansions']}")
+        return "\n".join(lines)
+
+    def to_json(self):
+        import json
+        return json.dumps(self.as_dict(), indent=2)
+
+
+class ProcedureRecord(PhaseRecord):
+    def __init__(self):
+        super().__init__()
+        self.instructions = 0
+        self.inline_expansions = 0
+
+    def as_dict(self):
+        result = super().as_dict()
+        result["instructions"] = self.instructions
+        result["inline_expansions"] = self.inline_expansions
+        return result
+
+
+# Measuring the phase only if the statistics were requested
+def measure(name, procedure=None):
+    stats = get_compiler_stats()
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.phase(name, procedure)
@@ -1,4 +1,4 @@
-from globals import get_global_consts_address, modify_global_consts_address, get_global_command_lineno
+from globals import get_global_command_lineno
 
 
 class Array:
@@ -30,7 +30,6 @@ class ProgramSymbols(dict):
     def __init__(self):
         super().__init__()
         self.memory_offset = 0
-        self.consts = {}
 
     def add_variable(self, name, offset=0):
         if name in self:
@@ -46,13 +45,6 @@ class ProgramSymbols(dict):
         self.setdefault(name, Array(name, self.memory_offset + offset, size))
         self.memory_offset += size
 
-    def add_const(self, value):
-        available_address = get_global_consts_address()
-        self.consts.setdefault(value, available_address)
-        modify_global_consts_address(available_address + 1)
-
-        return available_address
-
     def get_variable(self, name):
         if name in self:
             return self[name]
@@ -72,8 +64,4 @@ class ProgramSymbols(dict):
         if type(target) == str:
             return self.get_variable(target).memory_offset
         else:
-            return self.get_array_at(target[0], target[1])
-
-    def get_const(self, val):
-        if val in self.consts:
-            return self.consts[val]
\ No newline at end of file
+            return self.get_array_at(target[0], target[1])
\ No newline at end of file
@@ -0,0 +1,342 @@
+from symbols import Variable, Array
+from procedure_symbols import ProcedureVariable, ProcedureArgsVariable, ProcedureArray
+
+# Size of the code (counted roughly in commands) that an unrolled loop may take
+UNROLL_BUDGET = 64
+# Numbers of copies of the body tried when the loop is unrolled partially (the biggest one that fits first)
+UNROLL_FACTORS = (4, 2)
+# Loops with more iterations are never simulated
+MAX_TRIP_COUNT = 100000
+
+
+# Rough size of the commands' code (multiplications, divisions and procedures take much more than other commands)
+def code_size(commands):
+    def expression_size(expression):
+        if expression[0] in ("mul", "div", "mod") and not expression[1][0] == expression[2][0] == "const":
+            return 8
+        return 0
+
+    size = 0
+    for command in commands:
+        size += 1
+        if command[0] == "assign":
+            size += expression_size(command[2])
+        elif command[0] == "proc_call":
+            size += 16
+        elif command[0] in ("if", "while", "until"):
+            size += code_size(command[2])
+        elif command[0] == "ifelse":
+            size += code_size(command[2]) + code_size(command[3])
+        elif command[0] == "unrolled":
+            for _, block, _ in unrolled_blocks(command):
+                size += code_size(block)
+    return size
+
+
+# Names of the symbols that the commands may change (arguments of a called procedure may be changed inside of it)
+def changed_symbols(commands):
+    changed = set()
+    for command in commands:
+        if command[0] in ("assign", "read"):
+            changed.add(command[1] if type(command[1]) == str else command[1][1])
+        elif command[0] == "proc_call":
+            changed.update(command[1][1])
+        elif command[0] in ("if", "while", "until"):
+            changed |= changed_symbols(command[2])
+        elif command[0] == "ifelse":
+            changed |= changed_symbols(command[2]) | changed_symbols(command[3])
+        elif command[0] == "unrolled":
+            for _, block, _ in unrolled_blocks(command):
+                changed |= changed_symbols(block)
+        elif command[0] == "folded":
+            changed.update(cell[0] if type(cell[0]) == str else cell[0][1] for cell in command[3])
+    return changed
+
+
+"""
+Function returning the parts of an unrolled loop as tuples (condition, commands, repeated). The condition is checked
+before the commands (None if it is not), 'repeated' tells if the commands are a part of a loop.
+
+An unrolled loop is a tuple ("unrolled", setup, condition, copies, rest):
+- setup: commands created by the compiler that are done first (e.g. the bound of the loop)
+- condition: the copies are repeated as long as it is met (None if they are done once)
+- copies: lists of commands (copies of the loop's body)
+- rest: another unrolled loop done afterwards (None if there is none)
+"""
+def unrolled_blocks(command):
+    blocks = []
+    while command is not None:
+        _, setup, condition, copies, rest = command
+        blocks.append((None, setup, False))
+        for i, copy in enumerate(copies):
+            blocks.append((condition if i == 0 else None, copy, condition is not None))
+        command = rest
+    return blocks
+
+
+# Returns the step of the loop's counter if the command is 'i := i + step' or 'i := i - step' (negative)
+def counter_step(command, name):
+    if command[0] != "assign" or command[1] != name or len(command[2]) != 3:
+        return None
+    operation, first, second = command[2]
+    if operation == "add" and first == ("load", name) and second[0] == "const" and second[1] > 0:
+        return second[1]
+    if operation == "add" and second == ("load", name) and first[0] == "const" and first[1] > 0:
+        return first[1]
+    if operation == "sub" and first == ("load", name) and second[0] == "const" and second[1] > 0:
+        return -second[1]
+    return None
+
+
+def is_met(operation, x, y):
+    return {"lt": x < y, "le": x <= y, "gt": x > y, "ge": x >= y, "eq": x == y, "ne": x != y}[operation]
+
+
+# Class responsible for unrolling the loops of one encoder
+class LoopUnroller:
+    """
+    LoopUnroller's attributes are:
+    - symbols: symbols of the encoder (the bounds of partially unrolled loops are added to them)
+    - temporaries: number of the added symbols
+    - unrolled: number of unrolled loops
+    - cold_loops: ids of the 'while' commands that are not unrolled (their loops did not repeat in the profile)
+    """
+    def __init__(self, symbols, cold_loops=frozenset()):
+        self.symbols = symbols
+        self.temporaries = 0
+        self.unrolled = 0
+        self.cold_loops = cold_loops
+
+    def unroll_commands(self, commands):
+        result = []
+        for command in commands:
+            original = command
+            if command[0] in ("if", "while"):
+                command = (command[0], command[1], self.unroll_commands(command[2])) + command[3:]
+            elif command[0] == "ifelse":
+                command = (command[0], command[1], self.unroll_commands(command[2]),
+                           self.unroll_commands(command[3])) + command[4:]
+            elif command[0] == "until":
+                command = (command[0], command[1], self.unroll_commands(command[2]))
+            if command[0] == "while" and id(original) not in self.cold_loops:
+                unrolled = self.unroll_loop(command, result)
+                if unrolled is not None:
+                    self.unrolled += 1
+                    command = unrolled
+            result.append(command)
+        return result
+
+    # Returns the value given to the variable by the last command (if it is a constant)
+    def known_value(self, name, previous):
+        for command in reversed(previous):
+            if name in changed_symbols([command]):
+                if command[0] == "assign" and command[1] == name and command[2][0] == "const":
+                    return command[2][1]
+                if command[0] == "folded":
+                    return dict(command[3]).get(name)
+                return None
+        return None
+
+    def is_scalar(self, name, arguments=False):
+        types = (Variable, ProcedureVariable, ProcedureArgsVariable) if arguments else (Variable, ProcedureVariable)
+        return type(name) == str and type(self.symbols.get(name)) in types
+
+    def unroll_loop(self, command, previous):
+        condition, body = command[1], command[2]
+        if not body:
+            return None
+
+        # The counter is changed only by the last command of the body
+        name = body[-1][1]
+        if not self.is_scalar(name):
+            return None
+        step = counter_step(body[-1], name)
+        changed = changed_symbols(body[:-1])
+        if step is None or name in changed:
+            return None
+
+        # The condition compares the counter with the bound (the counter on the left)
+        operation, first, second = condition
+        if first == ("load", name):
+            bound = second
+        elif second == ("load", name):
+            operation, bound = {"lt": "gt", "le": "ge", "gt": "lt", "ge": "le"}.get(operation, operation), first
+        else:
+            return None
+        if bound[0] == "load" and not (self.is_scalar(bound[1], True) and bound[1] not in changed and bound[1] != name):
+            return None
+        if bound[0] == "load" and type(self.symbols[bound[1]]) == ProcedureArgsVariable and \
+                any(type(self.symbols.get(symbol)) == ProcedureArgsVariable for symbol in changed):
+            # The bound may be the same variable as a changed argument
+            return None
+
+        size = code_size(body)
+        start = self.known_value(name, previous)
+        if bound[0] == "const" and start is not None:
+            values = self.simulate(operation, start, step, bound[1])
+            if values is None:
+                return None
+            trip_count = len(values) - 1
+            # A loop that is never run is kept: its body is still encoded, so the symbols it assigns are initialized
+            # afterwards (with a warning where they are used) and the same programs are accepted
+            if trip_count == 0:
+                return None
+            if trip_count * size <= 2 * UNROLL_BUDGET and self.has_constant_indices(body, name, values[:-1]):
+                # Every copy gets the counter as a constant, only the last one sets the counter
+                copies = [substitute(body[:-1], name, value) for value in values[:-1]]
+                if trip_count > 0:
+                    copies.append([("assign", name, ("const", values[-1]))])
+                if sum(code_size(copy) for copy in copies) <= UNROLL_BUDGET:
+                    return "unrolled", [], None, copies, None
+            factor = self.unroll_factor(size)
+            if factor is None or trip_count < 2 * factor:
+                return None
+            # The copies are repeated as long as there are enough iterations left, the rest is done once
+            blocks = trip_count // factor * factor
+            block_condition = ("lt" if step > 0 else "gt", ("load", name), ("const", values[blocks]))
+            rest = None
+            if trip_count > blocks:
+                rest = ("unrolled", [], None, [body] * (trip_count - blocks), None)
+            return "unrolled", [], block_condition, [body] * factor, rest
+
+        factor = self.unroll_factor(size)
+        if factor is None or (step > 0) != (operation in ("lt", "le")) or operation in ("eq", "ne"):
+            return None
+        # The copies are repeated while the last of them still meets the condition,
+        # i + (factor - 1) * step < n is checked as i < n - (factor - 1) * step (0 if it is negative, like in the machine)
+        distance = (factor - 1) * abs(step)
+        if operation == "lt":
+            new_bound = ("sub", bound, ("const", distance))
+        elif operation == "le":
+            # i <= n - d is the same as i < n - (d - 1)
+            new_bound = ("sub", bound, ("const", distance - 1))
+        else:
+            new_bound = ("add", bound, ("const", distance))
+        block_operation = "lt" if operation in ("lt", "le") else operation
+        rest = ("unrolled", [], condition, [body], None)
+        if bound[0] == "const":
+            value = max(0, new_bound[1][1] - new_bound[2][1]) if new_bound[0] == "sub" else new_bound[1][1] + new_bound[2][1]
+            block_condition = (block_operation, ("load", name), ("const", value))
+            return "unrolled", [], block_condition, [body] * factor, rest
+        temporary = self.add_temporary()
+        block_condition = (block_operation, ("load", name), ("load", temporary))
+        return "unrolled", [("assign", temporary, new_bound)], block_condition, [body] * factor, rest
+
+    # Values of the counter before every iteration and after the last one (None if the loop is too long)
+    def simulate(self, operation, value, step, bound):
+        values = [value]
+        while is_met(operation, value, bound):
+            value = max(0, value + step)
+            values.append(value)
+            if len(values) > MAX_TRIP_COUNT:
+                return None
+        return values
+
+    def unroll_factor(self, size):
+        for factor in UNROLL_FACTORS:
+            if factor * size <= UNROLL_BUDGET:
+                return factor
+        return None
+
+    # The counter used as an index has to be in the range of the array for every value
+    def has_constant_indices(self, commands, name, values):
+        for array in indexed_arrays(commands, name):
+            symbol = self.symbols.get(array)
+            if type(symbol) not in (Array, ProcedureArray) or any(not 0 <= value < symbol.size for value in values):
+                return False
+        return True
+
+    def add_temporary(self):
+        # The name cannot be written in the program, so it never collides with the declared ones
+        self.temporaries += 1
+        name = f"unroll'{self.temporaries}"
+        self.symbols.add_variable(name)
+        return name
+
+
+# Names of the arrays indexed by the variable inside the commands
+def indexed_arrays(commands, name):
+    arrays = set()
+
+    def identifier(ident):
+        if type(ident) == tuple and ident[0] == "array" and ident[2] == ("load", name):
+            arrays.add(ident[1])
+
+    def expression(expr):
+        if expr[0] == "load":
+            identifier(expr[1])
+        elif expr[0] != "const":
+            expression(expr[1])
+            expression(expr[2])
+
+    for command in commands:
+        if command[0] in ("assign", "read"):
+            identifier(command[1])
+        if command[0] == "assign":
+            expression(command[2])
+        elif command[0] == "write":
+            expression(command[1])
+        elif command[0] in ("if", "while", "until"):
+            expression(command[1])
+            arrays |= indexed_arrays(command[2], name)
+        elif command[0] == "ifelse":
+            expression(command[1])
+            arrays |= indexed_arrays(command[2], name) | indexed_arrays(command[3], name)
+        elif command[0] == "unrolled":
+            for condition, block, _ in unrolled_blocks(command):
+                if condition is not None:
+                    expression(condition)
+                arrays |= indexed_arrays(block, name)
+    return arrays
+
+
+# Replacing the variable's value with the constant (the variable is not changed inside the commands)
+def substitute(commands, name, value):
+    def identifier(ident):
+        if type(ident) == tuple and ident[0] == "array" and ident[2] == ("load", name):
+            return "array", ident[1], value
+        return ident
+
+    def expression(expr):
+        if expr == ("load", name):
+            return "const", value
+        elif expr[0] == "load":
+            return "load", identifier(expr[1])
+        elif expr[0] == "const":
+            return expr
+        return expr[0], expression(expr[1]), expression(expr[2])
+
+    result = []
+    for command in commands:
+        if command[0] == "assign":
+            command = "assign", identifier(command[1]), expression(command[2])
+        elif command[0] == "read":
+            command = "read", identifier(command[1])
+        elif command[0] == "write":
+            command = "write", expression(command[1])
+        elif command[0] in ("if", "while"):
+            command = (command[0], expression(command[1]), substitute(command[2], name, value)) + command[3:]
+        elif command[0] == "ifelse":
+            command = (command[0], expression(command[1]), substitute(command[2], name, value),
+                       substitute(command[3], name, value)) + command[4:]
+        elif command[0] == "until":
+            command = command[0], expression(command[1]), substitute(command[2], name, value)
+        elif command[0] == "unrolled":
+            command = substitute_unrolled(command, name, value, expression)
+        result.append(command)
+    return result
+
+
+def substitute_unrolled(command, name, value, expression):
+    if command is None:
+        return None
+    _, setup, condition, copies, rest = command
+    return ("unrolled", substitute(setup, name, value), None if condition is None else expression(condition),
+            [substitute(copy, name, value) for copy in copies], substitute_unrolled(rest, name, value, expression))
+
+
+# Unrolling the loops of every encoder (before the memory layout, so it can see the new code)
+def unroll_loops(encoders, cold_loops=frozenset()):
+    for encoder in encoders:
+        unroller = LoopUnroller(encoder.symbols, cold_loops)
+        encoder.commands = unroller.unroll_commands(encoder.commands)
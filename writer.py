@@ -0,0 +1,88 @@
+# Class responsible for writing the generated code to the output file
+class TextCodeWriter:
+    """
+    TextCodeWriter's attributes are:
+    - file: output file (opened in the text mode)
+    - buffer: lines waiting to be written
+    - buffer_size: number of lines after which the buffer is written to the file
+    - count: number of written instructions
+    """
+    def __init__(self, file, buffer_size=4096):
+        self.file = file
+        self.buffer = []
+        self.buffer_size = buffer_size
+        self.count = 0
+
+    # Receives instructions whose jumps are already resolved
+    def write(self, lines):
+        self.buffer.extend(lines)
+        self.count += len(lines)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("\n".join(self.buffer))
+            self.file.write("\n")
+            self.buffer = []
+
+    def close(self, memory_size=0):
+        self.flush()
+
+
+# Order of the instructions is the same as in maszyna_wirtualna/instructions.hh
+OPCODES = {name: i for i, name in enumerate(["READ", "WRITE", "LOAD", "STORE", "ADD", "SUB", "GET", "PUT", "RST", "INC",
+                                             "DEC", "SHL", "SHR", "JUMP", "JPOS", "JZERO", "STRK", "JUMPR", "HALT"])}
+REGISTERS = {name: i for i, name in enumerate("abcdefgh")}
+BINARY_MAGIC = b"MWB1"
+
+
+# Class responsible for writing the generated code in the binary format read by the virtual machine
+class BinaryCodeWriter:
+    """
+    BinaryCodeWriter's attributes are:
+    - file: output file (opened in the binary mode)
+    - buffer: encoded instructions waiting to be written
+    - buffer_size: number of bytes after which the buffer is written to the file
+    - count: number of written instructions
+
+    The file starts with the header: b"MWB1", the number of instructions and the size of the used memory
+    (both as 8-byte little endian numbers). Then every instruction is one byte with its code and its argument
+    (the register's number or the jump's target, 0 if there is none) encoded as a varint.
+    """
+    def __init__(self, file, buffer_size=65536):
+        self.file = file
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+        self.count = 0
+        # The header is filled in when the number of instructions is known
+        self.file.write(BINARY_MAGIC + bytes(16))
+
+    def write(self, lines):
+        buffer = self.buffer
+        for line in lines:
+            parts = line.split()
+            buffer.append(OPCODES[parts[0]])
+            operand = 0
+            if len(parts) > 1:
+                operand = REGISTERS[parts[1]] if parts[1] in REGISTERS else int(parts[1])
+            # Seven bits per byte, the highest bit tells if there are more bytes
+            while operand > 0x7f:
+                buffer.append((operand & 0x7f) | 0x80)
+                operand >>= 7
+            buffer.append(operand)
+        self.count += len(lines)
+        if len(buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+
+    def close(self, memory_size=0):
+        self.flush()
+        self.file.seek(len(BINARY_MAGIC))
+        self.file.write(self.count.to_bytes(8, "little"))
+        self.file.write(memory_size.to_bytes(8, "little"))
+        self.file.seek(0, 2)